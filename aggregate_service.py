@@ -0,0 +1,305 @@
+import argparse
+import functools
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+
+from aggregation import FioulAggregate
+from logements_db import parse_filter
+from results_store import RESULTS_DIRECTORY, available_zones, load_manifest, load_results
+
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 4096
+
+# Service HTTP local des logements au fioul pondérés, en mémoire :
+#   GET /fioul?zone=A&year=2015:2019&TYPL=1,2&AEMM=1950:1969
+#   -> {"zone": "A", ..., "logements": {"2015": ..., "2016": ...}}
+#   GET /zones (années et codes de chaque zone), GET /stats (cache)
+# Filtres au format de logements_db.parse_filter : valeur, liste a,b,c ou
+# intervalle début:fin inclusif (borne vide = ouverte). Les agrégats partiels
+# (results/{zone}/partials, AEMM x TYPL) permettent de croiser TYPL et AEMM ;
+# une zone qui n'a que ses résultats (store ou JSON) accepte l'un ou l'autre.
+# Les réponses sont gardées dans un cache LRU.
+
+FILTERS = ("year", "TYPL", "AEMM")
+
+
+class ZoneIndex:
+
+    def __init__(self, years, aemm, typl, weights=None, par_annee_emmenagement=None, par_type_logement=None):
+        self.years = years
+        self.aemm = aemm
+        self.typl = typl
+        # weights : année d'enquête x AEMM x TYPL ; sinon les deux marges
+        self.weights = weights
+        self.par_annee_emmenagement = par_annee_emmenagement
+        self.par_type_logement = par_type_logement
+
+    @classmethod
+    def from_partials(cls, zone, results_directory=RESULTS_DIRECTORY):
+        manifest = load_manifest(zone, results_directory)
+        if not manifest:
+            return None
+        years = np.array(sorted(manifest), dtype=np.int64)
+        aggregates = [FioulAggregate.load(f'{results_directory}/{zone}/{manifest[year]["partial"]}')
+                      for year in years]
+        # Indice i de chaque axe = code i - 1, l'indice 0 (code -1) regroupe
+        # les valeurs manquantes
+        shape = tuple(max(a.weights.shape[axis] for a in aggregates) for axis in (0, 1))
+        weights = np.zeros((len(years),) + shape)
+        for row, aggregate in enumerate(aggregates):
+            n_aemm, n_typl = aggregate.weights.shape
+            weights[row, :n_aemm, :n_typl] = aggregate.weights
+        return cls(years, np.arange(shape[0]) - 1, np.arange(shape[1]) - 1, weights)
+
+    @classmethod
+    def from_results(cls, zone, results_directory=RESULTS_DIRECTORY):
+        results = load_results(zone, results_directory)
+        return cls(np.asarray(results.years), np.asarray(results.aemm), np.asarray(results.typl),
+                   par_annee_emmenagement=np.asarray(results.par_annee_emmenagement),
+                   par_type_logement=np.asarray(results.par_type_logement))
+
+    @staticmethod
+    def _selector(labels, value):
+        # Même convention que Cube.slice, None pour tout l'axe
+        if value is None:
+            return np.arange(len(labels))
+        if isinstance(value, tuple):
+            start, end = value
+            mask = labels >= 0
+            if start is not None:
+                mask &= labels >= start
+            if end is not None:
+                mask &= labels <= end
+            return np.flatnonzero(mask)
+        return np.flatnonzero(np.isin(labels, value))
+
+    def query(self, year=None, TYPL=None, AEMM=None):
+        rows = self._selector(self.years, year)
+        aemm = self._selector(self.aemm, AEMM)
+        # Sans filtre AEMM, total des marges TYPL comme par_type_logement des
+        # résultats : la case TYPL manquante n'en fait pas partie
+        typl = self._selector(self.typl, (None, None) if TYPL is None and AEMM is None else TYPL)
+        if self.weights is not None:
+            totals = self.weights[np.ix_(rows, aemm, typl)].sum(axis=(1, 2))
+        elif TYPL is not None and AEMM is not None:
+            raise ValueError("TYPL et AEMM ne peuvent être croisés sans les agrégats partiels de la zone")
+        elif AEMM is not None:
+            totals = self.par_annee_emmenagement[np.ix_(rows, aemm)].sum(axis=1)
+        else:
+            totals = self.par_type_logement[np.ix_(rows, typl)].sum(axis=1)
+        return {int(y): float(w) for y, w in zip(self.years[rows], totals)}
+
+    def describe(self):
+        # Années et codes non vides de la zone, pour les tableaux de bord
+        if self.weights is not None:
+            aemm, typl = self.aemm[self.weights.any(axis=(0, 2))], self.typl[self.weights.any(axis=(0, 1))]
+        else:
+            aemm, typl = self.aemm, self.typl
+        aemm = aemm[aemm >= 0]
+        return {"years": self.years.tolist(), "TYPL": [int(c) for c in typl if c >= 0],
+                "AEMM": [int(aemm.min()), int(aemm.max())], "croisement": self.weights is not None}
+
+
+def load_index(zones=None, results_directory=RESULTS_DIRECTORY):
+    # Agrégats partiels de la zone s'ils existent, ses résultats sinon
+    zones = zones or sorted(set(available_zones(results_directory)) |
+                            {zone for zone in os.listdir(results_directory)
+                             if os.path.exists(f'{results_directory}/{zone}/manifest.json')})
+    return {zone: ZoneIndex.from_partials(zone, results_directory) or ZoneIndex.from_results(zone, results_directory)
+            for zone in zones}
+
+
+class AggregateService:
+
+    def __init__(self, index, cache_size=CACHE_SIZE):
+        self.index = index
+        self.zones = encode({zone: zone_index.describe() for zone, zone_index in index.items()})
+        self.response = functools.lru_cache(maxsize=cache_size)(self._response)
+
+    def _response(self, params):
+        # params : paires (nom, valeur) triées de la requête ; (statut, JSON
+        # déjà encodé)
+        status, body = self._answer(dict(params))
+        return status, encode(body)
+
+    def _answer(self, params):
+        zone = params.pop("zone", None)
+        if zone not in self.index:
+            return 404, {"error": f"Zone inconnue : {zone}"}
+        unknown = [name for name in params if name not in FILTERS]
+        if unknown:
+            return 400, {"error": f"Filtres inconnus : {unknown}"}
+        try:
+            filters = dict(parse_filter(f"{name}={value}") for name, value in params.items())
+            logements = self.index[zone].query(**filters)
+        except ValueError as error:
+            return 400, {"error": str(error)}
+        return 200, dict(zone=zone, **{name: params.get(name) for name in FILTERS}, logements=logements)
+
+    def stats(self):
+        return encode(self.response.cache_info()._asdict())
+
+
+def encode(body):
+    return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 : les clients gardent leur connexion d'une requête à l'autre.
+    # Sans TCP_NODELAY, l'en-tête et le corps envoyés séparément attendent
+    # l'accusé de réception retardé du client (environ 40 ms par requête).
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        service = self.server.service
+        if url.path == "/fioul":
+            status, data = service.response(tuple(sorted(parse_qsl(url.query))))
+        elif url.path == "/zones":
+            status, data = 200, service.zones
+        elif url.path == "/stats":
+            status, data = 200, service.stats()
+        else:
+            status, data = 404, encode({"error": f"Chemin inconnu : {url.path}"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    # File d'attente de 5 connexions par défaut : au-delà, les connexions
+    # simultanées attendent la réémission du SYN (1 s, 3 s, ...)
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(index, host=HOST, port=PORT, cache_size=CACHE_SIZE):
+    server = Server((host, port), Handler)
+    server.service = AggregateService(index, cache_size)
+    return server
+
+
+def random_queries(zones, count, seed=0):
+    # Requêtes /fioul plausibles tirées des années et codes de chaque zone
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        zone = rng.choice(sorted(zones))
+        info = zones[zone]
+        params = {"zone": zone}
+        if rng.random() < 0.5:
+            first = rng.choice(info["years"])
+            params["year"] = f"{first}:{rng.choice([y for y in info['years'] if y >= first])}"
+        if rng.random() < 0.5:
+            params["TYPL"] = ",".join(str(code) for code in rng.sample(info["TYPL"], rng.randint(1, len(info["TYPL"]))))
+        if rng.random() < 0.5 and ("TYPL" not in params or info["croisement"]):
+            start = rng.randint(*info["AEMM"])
+            params["AEMM"] = f"{start}:{rng.randint(start, info['AEMM'][1])}"
+        paths.append("/fioul?" + urlencode(params, safe=":,"))
+    return paths
+
+
+def load_test(host=HOST, port=PORT, clients=16, requests=5000, distinct=500, seed=0):
+    # clients connexions simultanées (threads, une connexion HTTP/1.1 chacune)
+    # qui se partagent requests requêtes tirées parmi distinct requêtes
+    # différentes : latences par requête, débit global
+    connection = http.client.HTTPConnection(host, port)
+    connection.request("GET", "/zones")
+    zones = json.loads(connection.getresponse().read())
+    connection.close()
+    queries = random_queries(zones, distinct, seed)
+    rng = random.Random(seed + 1)
+    paths = [rng.choice(queries) for _ in range(requests)]
+
+    latencies = np.zeros(requests)
+    statuses = np.zeros(requests, dtype=np.int64)
+    start_barrier = threading.Barrier(clients)
+
+    def client(number):
+        connection = http.client.HTTPConnection(host, port)
+        start_barrier.wait()
+        for i in range(number, requests, clients):
+            started = time.perf_counter()
+            connection.request("GET", paths[i])
+            response = connection.getresponse()
+            response.read()
+            latencies[i] = time.perf_counter() - started
+            statuses[i] = response.status
+        connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {
+        "clients": clients,
+        "requests": requests,
+        "distinct": distinct,
+        "errors": int(np.count_nonzero(statuses >= 500)),
+        "rejected": int(np.count_nonzero((statuses >= 400) & (statuses < 500))),
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": p50,
+        "p90_ms": p90,
+        "p99_ms": p99,
+        "max_ms": latencies.max() * 1000,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Service HTTP des agrégats fioul et test de charge")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="sert les agrégats de results/")
+    serve_parser.add_argument("--zones", nargs="+", default=None)
+    serve_parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    serve_parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+
+    load_parser = subparsers.add_parser("load", help="test de charge d'un service lancé par serve")
+    load_parser.add_argument("--clients", type=int, default=16)
+    load_parser.add_argument("--requests", type=int, default=5000)
+    load_parser.add_argument("--distinct", type=int, default=500, help="nombre de requêtes différentes")
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.add_argument("--output", default=None, help="rapport JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "serve":
+        server = serve(load_index(args.zones, args.results_directory), args.host, args.port, args.cache_size)
+        print(f"http://{args.host}:{args.port}/fioul ({', '.join(server.service.index)})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        report = load_test(args.host, args.port, args.clients, args.requests, args.distinct, args.seed)
+        print(f"{report['requests']} requêtes, {report['clients']} clients : "
+              f"{report['requests_per_second']:.0f} req/s, p50 {report['p50_ms']:.2f} ms, "
+              f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms, "
+              f"{report['errors']} erreurs, {report['rejected']} refusées")
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,100 @@
+import numpy as np
+
+import run_report
+
+CMBL_FIOUL = 3
+
+
+def _codes(values):
+    # Valeur v -> indice v + 1, valeur manquante (NaN ou négative) -> indice 0
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values) | (values < 0)
+    return np.where(missing, 0, values + 1).astype(np.int64)
+
+
+class FioulAggregate:
+    # Tableau croisé pondéré (AEMM x TYPL) des logements d'une année d'enquête.
+    # weights contient la somme des IPONDL et counts le nombre de lignes de
+    # chaque case ; l'indice 0 de chaque axe regroupe les valeurs manquantes.
+
+    def __init__(self, shape=(1, 1)):
+        self.weights = np.zeros(shape, dtype=np.float64)
+        self.counts = np.zeros(shape, dtype=np.int64)
+
+    def _grow(self, shape):
+        shape = tuple(max(a, b) for a, b in zip(self.weights.shape, shape))
+        if shape == self.weights.shape:
+            return
+        weights = np.zeros(shape, dtype=np.float64)
+        counts = np.zeros(shape, dtype=np.int64)
+        n_aemm, n_typl = self.weights.shape
+        weights[:n_aemm, :n_typl] = self.weights
+        counts[:n_aemm, :n_typl] = self.counts
+        self.weights = weights
+        self.counts = counts
+
+    def add(self, aemm, typl, ipondl):
+        aemm_codes = _codes(aemm)
+        typl_codes = _codes(typl)
+        if len(aemm_codes) == 0:
+            return self
+        self._grow((aemm_codes.max() + 1, typl_codes.max() + 1))
+
+        n_aemm, n_typl = self.weights.shape
+        flat = aemm_codes * n_typl + typl_codes
+        ipondl = np.nan_to_num(np.asarray(ipondl, dtype=np.float64))
+        self.weights += np.bincount(flat, weights=ipondl,
+                                    minlength=n_aemm * n_typl).reshape(n_aemm, n_typl)
+        self.counts += np.bincount(flat, minlength=n_aemm * n_typl).reshape(n_aemm, n_typl)
+        return self
+
+    def merge(self, other):
+        self._grow(other.weights.shape)
+        n_aemm, n_typl = other.weights.shape
+        self.weights[:n_aemm, :n_typl] += other.weights
+        self.counts[:n_aemm, :n_typl] += other.counts
+        return self
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        aggregate = cls()
+        with np.load(path) as data:
+            aggregate.weights = data["weights"]
+            aggregate.counts = data["counts"]
+        return aggregate
+
+    def _present_aemm(self):
+        return np.flatnonzero(self.counts[1:, :].sum(axis=1)) + 1
+
+    def _present_typl(self):
+        return np.flatnonzero(self.counts[:, 1:].sum(axis=0)) + 1
+
+    def par_annee_emmenagement(self):
+        totals = self.weights.sum(axis=1)
+        return {int(code - 1): float(totals[code]) for code in self._present_aemm()}
+
+    def par_type_logement(self):
+        totals = self.weights.sum(axis=0)
+        return {int(code - 1): float(totals[code]) for code in self._present_typl()}
+
+    def par_annee_et_type(self):
+        present_typl = self._present_typl()
+        return {
+            int(a - 1): {int(t - 1): float(self.weights[a, t]) for t in present_typl}
+            for a in self._present_aemm()
+        }
+
+
+def aggregate_fioul(df, aggregate=None):
+    # Une seule passe sur les logements au fioul : AEMM, TYPL et AEMM x TYPL
+    if aggregate is None:
+        aggregate = FioulAggregate()
+    with run_report.stage("agregation") as entry:
+        mask = df["CMBL"].to_numpy() == CMBL_FIOUL
+        entry["rows"] += len(mask)
+        return aggregate.add(df["AEMM"].to_numpy()[mask],
+                             df["TYPL"].to_numpy()[mask],
+                             df["IPONDL"].to_numpy()[mask])
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from aggregation import aggregate_fioul
+from fd_logemt import read_year, zip_path
+from results_store import ZoneResults
+from synthetic_logemt import SYNTHETIC_DIRECTORY, write_year
+
+BENCHMARK_DIRECTORY = "results/benchmarks"
+
+# Écarts ignorés par la comparaison, quelle que soit la tolérance : les
+# étapes de quelques millisecondes varient d'un lancement à l'autre
+MIN_DELTA = {"seconds": 0.05, "peak_mb": 1.0}
+
+# Étapes du pipeline mesurées sur des fichiers synthétiques
+# (synthetic_logemt.py) : durée (meilleure de --repeat exécutions) puis pic
+# mémoire Python/numpy (tracemalloc, exécution séparée pour ne pas fausser
+# les durées).
+
+
+def measure(stage, repeat=3):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(durations), "peak_mb": peak / 1e6}
+
+
+def run(zone="A", years=(2014, 2015), rows=1_000_000, data_directory=SYNTHETIC_DIRECTORY,
+        repeat=3, dpi=100, regenerate=False):
+    for year in years:
+        if regenerate or not os.path.exists(zip_path(zone, year, data_directory)):
+            write_year(zone, year, rows, data_directory)
+
+    state = {}
+    results_directory = tempfile.mkdtemp(prefix="benchmark_")
+
+    def lecture():
+        state["frames"] = {year: read_year(zone, year, data_directory) for year in years}
+
+    def agregation():
+        state["aggregates"] = {year: aggregate_fioul(df) for year, df in state["frames"].items()}
+
+    def store():
+        state["results"] = ZoneResults.from_aggregates(state["aggregates"])
+        state["results"].save(zone, results_directory)
+
+    def export_json():
+        state["results"].export_json(zone, results_directory)
+
+    def rendu():
+        import region_data_reader
+        for name in region_data_reader.FIGURES:
+            region_data_reader.render_figure(zone, name, dpi, False, results_directory)
+
+    matplotlib.use("Agg")
+    stages = {}
+    try:
+        for name, stage in [("lecture", lecture), ("agregation", agregation), ("store", store),
+                            ("json", export_json), ("rendu", rendu)]:
+            stages[name] = measure(stage, repeat)
+            print(f"{name:<12} {stages[name]['seconds']:8.3f} s  {stages[name]['peak_mb']:8.1f} Mo")
+    finally:
+        shutil.rmtree(results_directory)
+
+    return {
+        "zone": zone,
+        "years": list(years),
+        "rows": int(sum(len(df) for df in state["frames"].values())),
+        "dpi": dpi,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "stages": stages,
+    }
+
+
+def regressions(report, baseline, tolerance=0.2):
+    # Étapes plus lentes ou plus gourmandes que la référence au-delà de tolerance
+    found = []
+    for name, measures in report["stages"].items():
+        reference = baseline["stages"].get(name)
+        if reference is None:
+            continue
+        for key in ("seconds", "peak_mb"):
+            if measures[key] > reference[key] * (1 + tolerance) and \
+                    measures[key] - reference[key] > MIN_DELTA[key]:
+                found.append(f"{name} {key} : {reference[key]:.3f} -> {measures[key]:.3f}")
+    return found
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline sur des fichiers FD_LOGEMT synthétiques")
+    parser.add_argument("--zone", default="A")
+    parser.add_argument("--years", nargs="+", type=int, default=[2014, 2015])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="lignes par année")
+    parser.add_argument("--data-directory", default=SYNTHETIC_DIRECTORY)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--regenerate", action="store_true",
+                        help="réécrire les zips synthétiques même s'ils existent")
+    parser.add_argument("--output", default=None,
+                        help=f"rapport JSON (par défaut {BENCHMARK_DIRECTORY}/benchmark_{{zone}}_{{lignes}}.json)")
+    parser.add_argument("--baseline", default=None, help="rapport de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args.zone, args.years, args.rows, args.data_directory, args.repeat, args.dpi, args.regenerate)
+
+    output = args.output or f"{BENCHMARK_DIRECTORY}/benchmark_{args.zone}_{args.rows}.json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Régression : {line}")
+        raise SystemExit(1 if found else 0)
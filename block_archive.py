@@ -0,0 +1,140 @@
+import argparse
+import io
+import json
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import run_report
+from columnar_cache import source_signature
+from fast_reader import BLOCK_SIZE, iter_blocks, iter_projected
+from fd_logemt import COLUMNS, STRING_COLUMNS, ZONES, available_years, member_name, zip_path
+
+BLOCKS_DIRECTORY = "data/blocks"
+
+REPACK_BLOCK_MB = 8
+# Niveau 1 : cinq fois plus rapide que le niveau 6 à la compression, même
+# vitesse de décompression, archive de la taille du zip d'origine
+COMPRESSION_LEVEL = 1
+
+# Reconditionnement des zips : le membre d'un zip est un seul flux deflate,
+# décompressé depuis le début par un seul processus. Ici chaque année est
+# découpée en blocs de lignes complètes (environ REPACK_BLOCK_MB Mo de texte)
+# compressés séparément avec zlib, les uns à la suite des autres dans
+# data/blocks/{zone}/{année}.blocks. L'index ({année}.index.json, écrit en
+# dernier) garde l'en-tête du fichier, la signature du zip d'origine et la
+# position, la taille et le nombre de lignes de chaque bloc : n'importe quel
+# bloc se lit seul, et une année se répartit entre plusieurs processus.
+
+
+def archive_path(zone, year, blocks_directory=BLOCKS_DIRECTORY):
+    return f"{blocks_directory}/{zone}/{year}.blocks"
+
+
+def index_path(zone, year, blocks_directory=BLOCKS_DIRECTORY):
+    return f"{blocks_directory}/{zone}/{year}.index.json"
+
+
+def repack_year(zone, year, data_directory="data/regions", blocks_directory=BLOCKS_DIRECTORY,
+                block_mb=REPACK_BLOCK_MB):
+    source = zip_path(zone, year, data_directory)
+    path = archive_path(zone, year, blocks_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blocks = []
+    offset = 0
+    with zipfile.ZipFile(source, 'r') as z, z.open(member_name(zone, year)) as member, \
+            open(f"{path}.tmp", 'wb') as f:
+        header = member.readline()
+        for block in iter_blocks(member, int(block_mb * 1024 * 1024)):
+            compressed = zlib.compress(block, COMPRESSION_LEVEL)
+            f.write(compressed)
+            blocks.append({"offset": offset, "size": len(compressed), "raw_size": len(block),
+                           "rows": block.count(b'\n')})
+            offset += len(compressed)
+    os.replace(f"{path}.tmp", path)
+    index = dict(source_signature(source), header=header.decode('latin-1'), blocks=blocks)
+    with open(f"{index_path(zone, year, blocks_directory)}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(f"{index_path(zone, year, blocks_directory)}.tmp", index_path(zone, year, blocks_directory))
+    return zone, year, index
+
+
+def load_index(zone, year, data_directory="data/regions", blocks_directory=BLOCKS_DIRECTORY):
+    # Index de l'année, None s'il manque ou si le zip a changé depuis
+    try:
+        with open(index_path(zone, year, blocks_directory), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    signature = source_signature(zip_path(zone, year, data_directory))
+    if any(index.get(k) != v for k, v in signature.items()):
+        return None
+    return index
+
+
+def read_blocks(zone, year, blocks, index, blocks_directory=BLOCKS_DIRECTORY):
+    # Texte des blocs demandés (indices dans index["blocks"]), un par un
+    with open(archive_path(zone, year, blocks_directory), 'rb') as f:
+        for number in blocks:
+            entry = index["blocks"][number]
+            with run_report.stage("decompression") as stage_entry:
+                f.seek(entry["offset"])
+                data = zlib.decompress(f.read(entry["size"]))
+                stage_entry["bytes"] += len(data)
+            yield data
+
+
+def iter_block_chunks(zone, year, blocks, index, blocks_directory=BLOCKS_DIRECTORY, columns=COLUMNS):
+    # DataFrames des colonnes projetées, bloc par bloc, comme iter_year_chunks
+    header = index["header"].encode('latin-1')
+    for data in read_blocks(zone, year, blocks, index, blocks_directory):
+        yield from iter_projected(io.BytesIO(header + data), columns, STRING_COLUMNS, BLOCK_SIZE)
+
+
+def split_blocks(index, parts):
+    # parts groupes de blocs consécutifs d'à peu près autant de texte
+    sizes = [entry["raw_size"] for entry in index["blocks"]]
+    parts = max(1, min(parts, len(sizes)))
+    total, groups, current, done = sum(sizes), [], [], 0
+    for number, size in enumerate(sizes):
+        current.append(number)
+        done += size
+        if done >= total * (len(groups) + 1) / parts and len(groups) < parts - 1:
+            groups.append(current)
+            current = []
+    return groups + [current] if current else groups
+
+
+def repack_zones(zones, years=None, workers=None, data_directory="data/regions",
+                 blocks_directory=BLOCKS_DIRECTORY, block_mb=REPACK_BLOCK_MB, force=False):
+    # Un processus par couple (zone, année) ; les années déjà reconditionnées
+    # depuis le même zip sont sautées
+    keys = [(zone, year) for zone in zones for year in available_years(zone, data_directory)
+            if (years is None or year in years)
+            and (force or load_index(zone, year, data_directory, blocks_directory) is None)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(repack_year, zone, year, data_directory, blocks_directory, block_mb)
+                   for zone, year in keys]
+        return [future.result() for future in futures]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reconditionnement des zips FD_LOGEMT en blocs compressés indexés")
+    parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    parser.add_argument("--years", nargs="+", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--block-mb", type=float, default=REPACK_BLOCK_MB, help="texte par bloc, en Mo")
+    parser.add_argument("--data-directory", default="data/regions")
+    parser.add_argument("--blocks-directory", default=BLOCKS_DIRECTORY)
+    parser.add_argument("--force", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for zone, year, index in repack_zones(args.zones, args.years, args.workers, args.data_directory,
+                                          args.blocks_directory, args.block_mb, args.force):
+        blocks = index["blocks"]
+        print(f"Zone {zone}, {year} : {len(blocks)} blocs, {sum(b['rows'] for b in blocks)} lignes, "
+              f"{sum(b['raw_size'] for b in blocks) / 1e6:.0f} Mo -> {sum(b['size'] for b in blocks) / 1e6:.0f} Mo")
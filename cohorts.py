@@ -0,0 +1,182 @@
+import argparse
+import os
+
+import numpy as np
+
+from commune_aggregates import CommuneTable, find_commune
+from fd_logemt import ZONES
+from results_store import DECENNIES_DEBUT, RESULTS_DIRECTORY, available_zones, load_results
+
+# Matrices de cohortes (année d'enquête x année d'emménagement) de plusieurs
+# zones ou communes à la fois, dans un seul tableau weights (géographie x
+# année d'enquête x AEMM) sur des axes communs : une case absente d'une
+# géographie vaut 0, present (géographie x année d'enquête) distingue une
+# enquête absente des données d'une géographie. La cohorte a d'une année d'enquête y regroupe les
+# logements au fioul emménagés l'année a ; son attrition entre deux
+# enquêtes y0 < y1 est 1 - (W[y1, a] / W[y0, a]) ** (1 / (y1 - y0)), par an,
+# pour les cohortes déjà installées en y0 (0 < a <= y0 : le code 0000 de
+# MOD_LOGEMT, logement ordinaire inoccupé, n'est pas une cohorte).
+
+
+class CohortMatrix:
+
+    def __init__(self, names, years, aemm, weights, present=None):
+        self.names = np.asarray(names)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.aemm = np.asarray(aemm, dtype=np.int64)
+        self.weights = weights
+        self.present = np.ones(weights.shape[:2], dtype=bool) if present is None else present
+
+    @classmethod
+    def from_results(cls, results, names):
+        # results : ZoneResults, un par géographie
+        return cls.merged(cls([name], r.years, r.aemm, np.asarray(r.par_annee_emmenagement)[None])
+                          for name, r in zip(names, results))
+
+    @classmethod
+    def merged(cls, parts):
+        # Géographies de plusieurs matrices placées sur l'union des années
+        # d'enquête et des AEMM, un bloc par matrice
+        parts = list(parts)
+        years = np.unique(np.concatenate([part.years for part in parts]))
+        aemm = np.unique(np.concatenate([part.aemm for part in parts]))
+        weights = np.zeros((sum(len(part.names) for part in parts), len(years), len(aemm)))
+        present = np.zeros(weights.shape[:2], dtype=bool)
+        start = 0
+        for part in parts:
+            rows, columns = np.searchsorted(years, part.years), np.searchsorted(aemm, part.aemm)
+            weights[start:start + len(part.names), rows[:, None], columns] = part.weights
+            present[start:start + len(part.names), rows] = part.present
+            start += len(part.names)
+        return cls(np.concatenate([part.names for part in parts]), years, aemm, weights, present)
+
+    @classmethod
+    def from_zones(cls, zones, results_directory=RESULTS_DIRECTORY):
+        return cls.from_results([load_results(zone, results_directory) for zone in zones], zones)
+
+    @classmethod
+    def from_communes(cls, table, communes=None):
+        # Toutes les communes d'une CommuneTable (ou celles demandées) en une
+        # seule somme : chaque case AEMM non vide de la table va à l'indice
+        # plat (commune, année, AEMM) du tableau
+        offsets, codes, cell_weights = table.aemm_offsets, table.aemm_codes, table.aemm_weights
+        rows = np.repeat(np.arange(len(table.commune)), np.diff(offsets))
+        keep = np.ones(len(rows), dtype=bool) if communes is None else np.isin(table.commune[rows],
+                                                                               np.asarray(communes, dtype=str))
+        rows, codes, cell_weights = rows[keep], np.asarray(codes)[keep], np.asarray(cell_weights)[keep]
+        names, geography = np.unique(table.commune[rows], return_inverse=True)
+        years, year = np.unique(table.year[rows], return_inverse=True)
+        aemm, column = np.unique(codes, return_inverse=True)
+        flat = (geography * len(years) + year) * len(aemm) + column
+        weights = np.bincount(flat, weights=cell_weights, minlength=len(names) * len(years) * len(aemm))
+        return cls(names, years, aemm, weights.reshape(len(names), len(years), len(aemm)))
+
+    def since(self, first=DECENNIES_DEBUT):
+        # Cohortes emménagées à partir de first (colonnes des heatmaps)
+        columns = self.aemm >= first
+        return CohortMatrix(self.names, self.years, self.aemm[columns], self.weights[:, :, columns], self.present)
+
+    def on_years(self, years):
+        # Lignes placées sur les années d'enquête données, 0 pour une année
+        # absente (lignes des heatmaps)
+        years = np.asarray(years, dtype=np.int64)
+        weights = np.zeros((len(self.names), len(years), len(self.aemm)))
+        present = np.zeros(weights.shape[:2], dtype=bool)
+        rows, known = np.searchsorted(self.years, years), np.isin(years, self.years)
+        weights[:, known] = self.weights[:, rows[known]]
+        present[:, known] = self.present[:, rows[known]]
+        return CohortMatrix(self.names, years, self.aemm, weights, present)
+
+    def matrix(self, name):
+        return self.weights[int(np.flatnonzero(self.names == name)[0])]
+
+    def installed(self):
+        # Masque (enquête précédente x AEMM) des cohortes suivies entre deux
+        # enquêtes : emménagées au plus tard l'année de la première, codes
+        # d'AEMM qui ne sont pas des années (0000 : logement inoccupé) exclus
+        return (self.aemm[None, :] > 0) & (self.aemm[None, :] <= self.years[:-1, None])
+
+    def surveyed(self):
+        # (géographie x paire d'enquêtes) : les deux enquêtes sont dans les
+        # données de la géographie
+        return self.present[:, :-1] & self.present[:, 1:]
+
+    def attrition(self):
+        # Attrition annuelle de chaque cohorte entre enquêtes successives
+        # (géographie x paire d'enquêtes x AEMM), NaN si la cohorte est vide
+        # à la première enquête, pas encore installée, ou si l'une des deux
+        # enquêtes manque à la géographie
+        before, after = self.weights[:, :-1], self.weights[:, 1:]
+        gaps = np.diff(self.years)[None, :, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = 1 - (after / before) ** (1 / gaps)
+        rates[:, ~self.installed()] = np.nan
+        rates[before <= 0] = np.nan
+        rates[~self.surveyed()] = np.nan
+        return rates
+
+    def stock_attrition(self):
+        # Attrition annuelle de l'ensemble des cohortes installées
+        # (géographie x paire d'enquêtes) : les nouveaux emménagés ne
+        # compensent pas les départs
+        installed = self.installed()[None]
+        before = np.where(installed, self.weights[:, :-1], 0).sum(axis=2)
+        after = np.where(installed, self.weights[:, 1:], 0).sum(axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = 1 - (after / before) ** (1 / np.diff(self.years)[None, :])
+        return np.where((before > 0) & self.surveyed(), rates, np.nan)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, names=self.names, years=self.years, aemm=self.aemm, weights=self.weights,
+                 present=self.present)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["names"], data["years"], data["aemm"], data["weights"], data["present"])
+
+
+def zone_communes(zones, communes=(), results_directory=RESULTS_DIRECTORY):
+    # Toutes les communes des zones, plus les communes isolées (cherchées
+    # dans les tables de toutes les zones)
+    tables = [CommuneTable.load(zone, results_directory) for zone in zones]
+    missing = [zone for zone, table in zip(zones, tables) if table is None]
+    if missing:
+        raise ValueError(f"Pas de table des communes pour {missing}, lancer commune_aggregates.py build")
+    parts = [CohortMatrix.from_communes(table) for table in tables]
+    parts += [CohortMatrix.from_communes(find_commune(commune, results_directory), [commune])
+              for commune in communes]
+    return parts[0] if len(parts) == 1 else CohortMatrix.merged(parts)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Matrices de cohortes (enquête x emménagement) et attrition")
+    parser.add_argument("--zones", nargs="+", default=[], help="par défaut : toutes les zones de results/")
+    parser.add_argument("--communes-of", nargs="+", default=[], choices=list(ZONES),
+                        help="toutes les communes de ces zones (tables de commune_aggregates.py)")
+    parser.add_argument("--communes", nargs="+", default=[])
+    parser.add_argument("--first-aemm", type=int, default=DECENNIES_DEBUT)
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    parser.add_argument("--output", default=None, help="matrices et attritions (.npz), ex. results/cohorts/A.npz")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.communes_of or args.communes:
+        cohorts = zone_communes(args.communes_of, args.communes, args.results_directory)
+    else:
+        cohorts = CohortMatrix.from_zones(args.zones or available_zones(args.results_directory),
+                                          args.results_directory)
+    # Attrition sur toutes les cohortes, matrices à partir de --first-aemm
+    attrition, stock = cohorts.attrition(), cohorts.stock_attrition()
+    if args.output:
+        cohorts.since(args.first_aemm).save(args.output)
+        np.savez(args.output.replace(".npz", "_attrition.npz"), names=cohorts.names, years=cohorts.years,
+                 aemm=cohorts.aemm, attrition=attrition, stock_attrition=stock)
+    print("géographie", *(f"{y0}-{y1}" for y0, y1 in zip(cohorts.years[:-1], cohorts.years[1:])))
+    for name, rates in zip(cohorts.names[:50], stock[:50]):
+        print(name, *(f"{rate:6.1%}" if np.isfinite(rate) else "     -" for rate in rates))
+    if len(cohorts.names) > 50:
+        print(f"... {len(cohorts.names)} géographies")
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import run_report
+from fd_logemt import COLUMNS, ZONES, memory_footprint, read_extract, read_year, zip_path
+
+CACHE_DIRECTORY = "cache"
+
+# Cache colonne par colonne des années décodées : un fichier .npy typé par
+# colonne, relu en mémoire mappée, plus un meta.json qui identifie la source
+
+
+def cache_directory_for(key, year, cache_directory=CACHE_DIRECTORY):
+    return f"{cache_directory}/{key}/{year}"
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_cache(df, directory, signature):
+    os.makedirs(directory, exist_ok=True)
+    for column in df.columns:
+        np.save(f"{directory}/{column}.npy", df[column].to_numpy())
+    meta = dict(signature, columns=list(df.columns), rows=len(df))
+    # meta.json est écrit en dernier : un cache interrompu reste invalide
+    with open(f"{directory}/meta.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_cache(directory, signature):
+    try:
+        with open(f"{directory}/meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if any(meta.get(k) != v for k, v in signature.items()):
+        return None
+    columns = {c: np.load(f"{directory}/{c}.npy", mmap_mode='r') for c in meta["columns"]}
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_year(zone, year, data_directory="data/regions", cache_directory=CACHE_DIRECTORY, compact=False):
+    # Les types compacts ont leur propre cache ({année}-compact) ; un cache
+    # écrit avec d'autres colonnes est relu depuis le zip
+    signature = dict(source_signature(zip_path(zone, year, data_directory)), columns=COLUMNS)
+    directory = cache_directory_for(zone, f"{year}-compact" if compact else year, cache_directory)
+    with run_report.stage("cache") as entry:
+        df = read_cache(directory, signature)
+        entry["rows"] += 0 if df is None else len(df)
+    if df is None:
+        df = read_year(zone, year, data_directory, compact=compact)
+        with run_report.stage("ecriture_cache") as entry:
+            write_cache(df, directory, signature)
+            entry["rows"] += len(df)
+    return df
+
+
+def load_csv(path, key, year, cache_directory=CACHE_DIRECTORY, compact=False):
+    # Extraits communaux (data/melun/melun_{year}.csv, ...) déjà décompressés
+    signature = dict(source_signature(path), columns=COLUMNS)
+    directory = cache_directory_for(key, f"{year}-compact" if compact else year, cache_directory)
+    df = read_cache(directory, signature)
+    if df is None:
+        df = read_extract(path, year, compact=compact)
+        write_cache(df, directory, signature)
+    return df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Conversion des zips FD_LOGEMT en cache colonnes")
+    parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    parser.add_argument("--first-year", type=int, default=2010)
+    parser.add_argument("--last-year", type=int, default=2022)
+    parser.add_argument("--data-directory", default="data/regions")
+    parser.add_argument("--cache-directory", default=CACHE_DIRECTORY)
+    parser.add_argument("--compact", action="store_true",
+                        help="codes en petits entiers et poids en float32")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for zone in args.zones:
+        for year in range(args.first_year, args.last_year + 1):
+            df = load_year(zone, year, args.data_directory, args.cache_directory, args.compact)
+            print(f"Zone {zone}, {year} : {len(df)} lignes, {memory_footprint(df) / 1e6:.1f} Mo")
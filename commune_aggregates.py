@@ -0,0 +1,243 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import run_report
+from aggregation import CMBL_FIOUL, _codes
+from fd_logemt import (COLUMNS, ZONES, available_years, block_size_for_budget, iter_year_chunks,
+                       memory_budget)
+from results_store import RESULTS_DIRECTORY, ZoneResults, save_arrays
+
+DATA_DIRECTORY = "data/regions"
+
+VARIABLES = ("AEMM", "TYPL")
+FIELDS = ("offsets", "codes", "weights", "counts")
+ARRAYS = ("commune", "year") + tuple(f"{variable.lower()}_{field}" for variable in VARIABLES for field in FIELDS)
+
+# Agrégats fioul de toutes les communes d'une zone en une seule lecture de
+# chaque zip, au lieu d'un extrait par commune (csv_commune_filter.py) :
+# somme des IPONDL et nombre de lignes par AEMM et par TYPL. La table
+# (results/{zone}/communes/*.npy, relue en mémoire mappée) a une ligne par
+# couple (COMMUNE, année) trié ; les cases non vides de la ligne i sont
+# codes[offsets[i]:offsets[i + 1]]. Les communes sans logement au fioul une
+# année n'ont pas de ligne pour cette année.
+
+
+def table_directory(zone, results_directory=RESULTS_DIRECTORY):
+    return f'{results_directory}/{zone}/communes'
+
+
+def _reduce(communes, codes, weights, counts):
+    # Sommes par couple (commune, code), codes manquants (-1) exclus
+    present = codes >= 0
+    communes, codes, weights, counts = communes[present], codes[present], weights[present], counts[present]
+    names, rows = np.unique(communes, return_inverse=True)
+    n_codes = int(codes.max(initial=0)) + 1
+    keys, cells = np.unique(rows * n_codes + codes, return_inverse=True)
+    return (names[keys // n_codes], (keys % n_codes).astype(np.int16),
+            np.bincount(cells, weights=weights, minlength=len(keys)),
+            np.bincount(cells, weights=counts, minlength=len(keys)).astype(np.int32))
+
+
+class CommuneAggregate:
+    # Une année d'enquête : cases non vides (commune, code) de AEMM et de
+    # TYPL de chaque bloc, réduites en fin d'année. Un tableau dense
+    # communes x AEMM (codes jusqu'à l'année d'enquête, comme FioulAggregate)
+    # ferait des centaines de Mo pour une zone.
+
+    def __init__(self):
+        empty = (np.array([], dtype=str), np.array([], dtype=np.int16), np.array([]), np.array([], dtype=np.int32))
+        self.parts = {variable: [empty] for variable in VARIABLES}
+
+    def add(self, communes, aemm, typl, ipondl):
+        if len(communes) == 0:
+            return self
+        communes = np.asarray(communes).astype(str)
+        ipondl = np.nan_to_num(np.asarray(ipondl, dtype=np.float64))
+        for variable, values in zip(VARIABLES, (aemm, typl)):
+            self.parts[variable].append(_reduce(communes, _codes(values) - 1, ipondl,
+                                                np.ones(len(communes), dtype=np.int32)))
+        return self
+
+    def cells(self, year):
+        # {variable: (communes, années, codes, poids, lignes)}, une entrée par
+        # case non vide hors valeurs manquantes
+        cells = {}
+        for variable in VARIABLES:
+            communes, codes, weights, counts = (np.concatenate(arrays) for arrays in zip(*self.parts[variable]))
+            communes, codes, weights, counts = _reduce(communes, codes, weights, counts)
+            cells[variable] = (communes, np.full(len(codes), year, dtype=np.int16), codes, weights, counts)
+        return cells
+
+
+def concatenate_cells(parts):
+    return {variable: tuple(np.concatenate(arrays) for arrays in zip(*(part[variable] for part in parts)))
+            for variable in VARIABLES}
+
+
+def aggregate_communes(zone, year, memory_budget_mb=256, data_directory=DATA_DIRECTORY):
+    # Zip lu par blocs comme en streaming, COMMUNE en plus des colonnes fioul
+    aggregate = CommuneAggregate()
+    block_size = block_size_for_budget(memory_budget_mb)
+    for chunk in iter_year_chunks(zone, year, block_size, data_directory, COLUMNS + ["COMMUNE"]):
+        with run_report.stage("agregation") as entry:
+            mask = chunk["CMBL"].to_numpy() == CMBL_FIOUL
+            entry["rows"] += len(mask)
+            aggregate.add(chunk["COMMUNE"].to_numpy()[mask], chunk["AEMM"].to_numpy()[mask],
+                          chunk["TYPL"].to_numpy()[mask], chunk["IPONDL"].to_numpy()[mask])
+    return zone, year, aggregate.cells(year)
+
+
+class CommuneTable:
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_cells(cls, cells):
+        # cells : {variable: (communes, années, codes, poids, lignes)}, cases
+        # dans n'importe quel ordre. Clé entière commune x année pour trier
+        # les cases et retrouver le début de chaque ligne.
+        communes = np.unique(np.concatenate([values[0] for values in cells.values()]))
+        years = np.unique(np.concatenate([values[1] for values in cells.values()]))
+        keys = {variable: np.searchsorted(communes, values[0]) * len(years) + np.searchsorted(years, values[1])
+                for variable, values in cells.items()}
+        row_keys = np.unique(np.concatenate(list(keys.values())))
+        arrays = dict(commune=communes[row_keys // len(years)], year=years[row_keys % len(years)])
+        for variable, (_, _, codes, weights, counts) in cells.items():
+            order = np.lexsort((codes, keys[variable]))
+            prefix = variable.lower()
+            arrays[f"{prefix}_offsets"] = np.r_[np.searchsorted(keys[variable][order], row_keys), len(order)]
+            arrays[f"{prefix}_codes"] = codes[order]
+            arrays[f"{prefix}_weights"] = weights[order]
+            arrays[f"{prefix}_counts"] = counts[order]
+        return cls(arrays)
+
+    def cells(self, years=None):
+        # Inverse de from_cells, années d'enquête choisies seulement
+        cells = {}
+        for variable in VARIABLES:
+            offsets, codes, weights, counts = (getattr(self, f"{variable.lower()}_{field}") for field in FIELDS)
+            rows = np.repeat(np.arange(len(self.commune)), np.diff(offsets))
+            keep = slice(None) if years is None else np.isin(self.year[rows], list(years))
+            cells[variable] = (self.commune[rows][keep], self.year[rows][keep],
+                               codes[keep], weights[keep], counts[keep])
+        return cells
+
+    def save(self, zone, results_directory=RESULTS_DIRECTORY):
+        save_arrays(table_directory(zone, results_directory), {name: getattr(self, name) for name in ARRAYS},
+                    {"years": sorted({int(y) for y in self.year}), "communes": len(np.unique(self.commune)),
+                     "rows": len(self.commune)})
+
+    @classmethod
+    def load(cls, zone, results_directory=RESULTS_DIRECTORY):
+        directory = table_directory(zone, results_directory)
+        if not os.path.exists(f'{directory}/meta.json'):
+            return None
+        return cls({name: np.load(f'{directory}/{name}.npy', mmap_mode='r') for name in ARRAYS})
+
+    def rows(self, commune):
+        # Lignes de la commune (une par année d'enquête), par recherche
+        # dichotomique dans la colonne commune triée
+        start = int(np.searchsorted(self.commune, commune, side='left'))
+        return range(start, int(np.searchsorted(self.commune, commune, side='right')))
+
+    def par_variable(self, commune, variable):
+        # {année: {code: poids}}, format des fichiers JSON de results/
+        offsets, codes, weights = (getattr(self, f"{variable.lower()}_{field}")
+                                   for field in ("offsets", "codes", "weights"))
+        result = {}
+        for row in self.rows(commune):
+            cells = slice(offsets[row], offsets[row + 1])
+            result[int(self.year[row])] = dict(zip(codes[cells].tolist(), weights[cells].tolist()))
+        return result
+
+    def par_annee_emmenagement(self, commune):
+        return self.par_variable(commune, "AEMM")
+
+    def par_type_logement(self, commune):
+        return self.par_variable(commune, "TYPL")
+
+    def zone_results(self, commune):
+        # Résultats d'une commune au format d'une zone : figures de
+        # region_data_reader.py sans relire les fichiers détail
+        return ZoneResults.from_dicts(self.par_annee_emmenagement(commune), self.par_type_logement(commune))
+
+
+def find_commune(commune, results_directory=RESULTS_DIRECTORY):
+    for zone in ZONES:
+        table = CommuneTable.load(zone, results_directory)
+        if table is not None and len(table.rows(commune)):
+            return table
+    raise KeyError(f"Commune {commune} absente des tables de {results_directory}")
+
+
+def build_communes(zones, years=None, workers=None, memory_budget_mb=256, data_directory=DATA_DIRECTORY,
+                   results_directory=RESULTS_DIRECTORY):
+    # Un processus par couple (zone, année) ; les années non relues d'une
+    # table existante sont conservées
+    reports = {zone: run_report.RunReport() for zone in zones}
+    cells = {zone: [] for zone in zones}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_report.collect, aggregate_communes, zone, year, memory_budget_mb, data_directory)
+                   for zone in zones for year in available_years(zone, data_directory)
+                   if years is None or year in years]
+        for future in as_completed(futures):
+            (zone, year, year_cells), report = future.result()
+            reports[zone].merge(report)
+            cells[zone].append((year, year_cells))
+
+    tables = {}
+    for zone in zones:
+        built = [year for year, _ in cells[zone]]
+        previous = CommuneTable.load(zone, results_directory)
+        if previous is not None:
+            kept = sorted({int(y) for y in previous.year} - set(built))
+            cells[zone].append((None, previous.cells(kept)))
+        if not cells[zone]:
+            continue
+        with run_report.active(reports[zone]), run_report.stage("ecriture"):
+            tables[zone] = CommuneTable.from_cells(concatenate_cells([values for _, values in cells[zone]]))
+            tables[zone].save(zone, results_directory)
+        reports[zone].save(f'{results_directory}/{zone}/run_report_communes.json',
+                           pipeline="commune_aggregates", zone=zone, workers=workers, processed=sorted(built))
+    return tables
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agrégats fioul de toutes les communes d'une zone")
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="une lecture de chaque zip pour toutes les communes")
+    build_parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    build_parser.add_argument("--years", nargs="+", type=int, default=None,
+                              help="par défaut : toutes les années présentes dans --data-directory")
+    build_parser.add_argument("--workers", type=int, default=None)
+    build_parser.add_argument("--memory-budget-mb", type=memory_budget, default=256)
+    build_parser.add_argument("--data-directory", default=DATA_DIRECTORY)
+
+    show_parser = subparsers.add_parser("show", help="logements au fioul d'une commune par année et par TYPL")
+    show_parser.add_argument("commune")
+
+    export_parser = subparsers.add_parser("export", help="résultats d'une commune dans results/{commune}/store")
+    export_parser.add_argument("communes", nargs="+")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "build":
+        for zone, table in build_communes(args.zones, args.years, args.workers, args.memory_budget_mb,
+                                          args.data_directory, args.results_directory).items():
+            print(f"Zone {zone} : {len(np.unique(table.commune))} communes, {len(table.commune)} lignes")
+    elif args.command == "show":
+        par_type_logement = find_commune(args.commune, args.results_directory).par_type_logement(args.commune)
+        for year, values in par_type_logement.items():
+            print(year, f"{sum(values.values()):.0f}", {code: round(weight) for code, weight in values.items()})
+    else:
+        for commune in args.communes:
+            find_commune(commune, args.results_directory).zone_results(commune).save(commune, args.results_directory)
@@ -0,0 +1,70 @@
+import json
+import os
+
+# Index des fichiers détail FD_LOGEMT : pour chaque code COMMUNE, les plages
+# d'octets [début, fin) de ses lignes. Les lignes étant regroupées par
+# commune, une ou deux plages suffisent en général.
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def index_path(csv_path):
+    return f"{csv_path}.idx.json"
+
+
+def build_index(csv_path):
+    ranges = {}
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        offset = len(header)
+        current, start = None, offset
+        for line in f:
+            code = line.split(b';', 1)[0].decode('ascii')
+            if code != current:
+                if current is not None:
+                    ranges.setdefault(current, []).append([start, offset])
+                current, start = code, offset
+            offset += len(line)
+        if current is not None:
+            ranges.setdefault(current, []).append([start, offset])
+
+    stat = os.stat(csv_path)
+    index = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+             "header": [0, len(header)], "communes": ranges}
+    with open(index_path(csv_path), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index
+
+
+def load_index(csv_path):
+    stat = os.stat(csv_path)
+    try:
+        with open(index_path(csv_path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+            return index
+    except FileNotFoundError:
+        pass
+    return build_index(csv_path)
+
+
+def _copy_range(f_in, f_out, start, end):
+    f_in.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = f_in.read(min(COPY_BUFFER_SIZE, remaining))
+        if not block:
+            break
+        f_out.write(block)
+        remaining -= len(block)
+
+
+def extract_commune(csv_path, code_insee, output_path):
+    # Quelques seek + copies en bloc au lieu d'un parcours complet du fichier
+    index = load_index(csv_path)
+    ranges = index["communes"].get(str(code_insee), [])
+    with open(csv_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        _copy_range(f_in, f_out, *index["header"])
+        for start, end in ranges:
+            _copy_range(f_in, f_out, start, end)
+    return sum(end - start for start, end in ranges)
@@ -1,13 +1,119 @@
-year = 2020
+import argparse
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
-input_file = f'data/FD_LOGEMTZA_{year}.csv'
-output_file = f'data/melun/melun_{year}.csv'
-code_insee = 77288
+from commune_index import extract_commune
+from fd_logemt import available_years, member_name, zip_path
 
-with open(input_file, mode='r') as f_in, open(output_file, mode='w') as f_out:
-    header = f_in.readline()
-    f_out.write(header)
+FIRST_YEAR = 2010
+LAST_YEAR = 2022
 
-    for line in f_in:
-        if line.startswith(str(code_insee)):
-            f_out.write(line)
+DATA_DIRECTORY = "data/regions"
+OUTPUT_DIRECTORY = "data/communes"
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+MAX_LINES_PER_WRITE = 10_000
+
+
+def output_path(name, year, output_directory=OUTPUT_DIRECTORY):
+    # name : code INSEE par défaut, ou nom choisi (melun -> data/melun/melun_{année}.csv
+    # avec output_directory="data", fichiers lus par melun_analysis.py)
+    return f"{output_directory}/{name}/{name}_{year}.csv"
+
+
+def extract_communes(zone, year, codes_insee, output_directory=OUTPUT_DIRECTORY,
+                     data_directory=DATA_DIRECTORY, names=None):
+    # Une seule décompression du membre du zip pour toutes les communes
+    # demandées ; le champ COMMUNE est comparé exactement (77288 ne capte
+    # pas 772880). Les lignes d'une même commune étant contiguës, elles sont
+    # accumulées puis écrites en un seul bloc.
+    codes = {str(code).encode('ascii') for code in codes_insee}
+    names = {str(code).encode('ascii'): name for code, name in (names or {}).items()}
+    outputs = {}
+    rows = {code: 0 for code in codes}
+
+    def flush(code, lines):
+        if code not in outputs:
+            path = output_path(names.get(code, code.decode('ascii')), year, output_directory)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            outputs[code] = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+            outputs[code].write(header)
+        outputs[code].write(b''.join(lines))
+        rows[code] += len(lines)
+
+    try:
+        with zipfile.ZipFile(zip_path(zone, year, data_directory), 'r') as z:
+            with z.open(member_name(zone, year)) as f_in:
+                header = f_in.readline()
+                current, lines = None, []
+                for line in f_in:
+                    code = line[:line.find(b';')]
+                    if code != current or len(lines) >= MAX_LINES_PER_WRITE:
+                        if lines:
+                            flush(current, lines)
+                        current, lines = code, []
+                    if code in codes:
+                        lines.append(line)
+                if lines:
+                    flush(current, lines)
+    finally:
+        for f_out in outputs.values():
+            f_out.close()
+
+    return year, {code.decode('ascii'): count for code, count in rows.items()}
+
+
+def extract_communes_years(zone, years, codes_insee, output_directory=OUTPUT_DIRECTORY,
+                           data_directory=DATA_DIRECTORY, workers=None, names=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_communes, zone, year, codes_insee, output_directory, data_directory,
+                               names)
+                   for year in years]
+        return dict(future.result() for future in futures)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extraction des lignes FD_LOGEMT de communes choisies")
+    parser.add_argument("codes", nargs="+", help="codes INSEE des communes (ex. 77288)")
+    parser.add_argument("--zone", default="A")
+    parser.add_argument("--first-year", type=int, default=FIRST_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data-directory", default=DATA_DIRECTORY)
+    parser.add_argument("--output-directory", default=OUTPUT_DIRECTORY)
+    parser.add_argument("--names", nargs="+", default=[],
+                        help="noms des fichiers, dans l'ordre des codes (ex. 77288 --names melun)")
+    parser.add_argument("--csv", help="fichier FD_LOGEMT déjà décompressé : extraction via "
+                                      "l'index des plages d'octets (année --first-year)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    names = dict(zip(args.codes, args.names))
+    if args.csv:
+        for code_insee in args.codes:
+            path = output_path(names.get(code_insee, code_insee), args.first_year, args.output_directory)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            extract_commune(args.csv, code_insee, path)
+    else:
+        # Années sans zip sautées, comme dans region_data_generator.py
+        requested = range(args.first_year, args.last_year + 1)
+        years = [year for year in available_years(args.zone, args.data_directory) if year in requested]
+        missing = [year for year in requested if year not in years]
+        if not years:
+            raise SystemExit(f"Aucun zip de la zone {args.zone} dans {args.data_directory} "
+                             f"pour {args.first_year}-{args.last_year}")
+        if missing:
+            print(f"Zone {args.zone} : pas de zip pour {missing}, années sautées")
+        rows = extract_communes_years(args.zone, years, args.codes,
+                                      args.output_directory, args.data_directory, args.workers, names)
+        for year, counts in sorted(rows.items()):
+            print(year, counts)
+        # Commune sans ligne une année : pas de fichier pour cette année
+        for code_insee in args.codes:
+            empty = [year for year, counts in sorted(rows.items()) if not counts[code_insee]]
+            if empty:
+                print(f"Commune {code_insee} : aucune ligne en {empty} dans la zone {args.zone}, "
+                      f"pas d'extrait écrit")
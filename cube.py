@@ -0,0 +1,219 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import run_report
+from columnar_cache import load_csv
+from fd_logemt import ZONES, read_year
+
+FIRST_YEAR = 2010
+LAST_YEAR = 2022
+
+CUBE_PATH = "results/cube.npz"
+
+CUBE_COLUMNS = ["CMBL", "IPONDL", "AEMM", "TYPL", "REGION"]
+AXES = ("year", "CMBL", "TYPL", "AEMM", "REGION")
+
+# Chaque axe porte la liste de ses codes ; le code MISSING (dernière case de
+# chaque axe) regroupe les valeurs manquantes ou hors nomenclature. counts
+# (nombre de lignes de chaque case) suit weights. Deux cubes aux axes
+# différents (années, AEMM) se fusionnent sur l'union de leurs codes : les
+# cubes partiels par (zone, année) du générateur s'additionnent en totaux
+# nationaux ou par régions (rollup.py).
+MISSING = -1
+
+# Fin de l'axe AEMM commune à tous les millésimes jusqu'en 2025 : les cubes
+# partiels de chaque année ont les mêmes axes et s'additionnent sans
+# réalignement
+AEMM_FIN = 2030
+
+
+def default_axes(years):
+    regions = sorted(region for regions in ZONES.values() for region in regions)
+    return {
+        "year": np.array(list(years)),
+        "CMBL": np.array([1, 2, 3, 4, 5, 6, MISSING]),
+        "TYPL": np.array([1, 2, 3, 4, 5, 6, MISSING]),
+        "AEMM": np.array([0] + list(range(1890, max(max(years) + 5, AEMM_FIN))) + [MISSING]),
+        "REGION": np.array(regions + [MISSING]),
+    }
+
+
+def _axis_index(labels, values):
+    # Position de chaque valeur dans l'axe, la case MISSING sinon
+    codes = labels[:-1]
+    order = np.argsort(codes)
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=MISSING)
+    positions = np.searchsorted(codes[order], values).clip(0, len(codes) - 1)
+    index = order[positions]
+    return np.where(codes[index] == values, index, len(codes))
+
+
+def _union(labels):
+    # Codes triés, MISSING en dernier si l'un des axes l'a (pas l'axe year)
+    codes = sorted({int(code) for axis in labels for code in axis if code != MISSING})
+    return np.array(codes + [MISSING] * any(MISSING in axis for axis in labels))
+
+
+class Cube:
+    # Cube dense des logements pondérés par IPONDL, indexé par AXES
+
+    def __init__(self, weights, axes, counts=None):
+        self.weights = weights
+        self.axes = axes
+        self.counts = np.zeros(weights.shape, dtype=np.int64) if counts is None else counts
+
+    @classmethod
+    def empty(cls, years):
+        axes = default_axes(years)
+        return cls(np.zeros(tuple(len(axes[name]) for name in AXES)), axes)
+
+    @classmethod
+    def merged(cls, cubes):
+        # Somme de cubes quelconques, axes alignés sur l'union des codes
+        cubes = list(cubes)
+        axes = {name: _union([cube.axes[name] for cube in cubes]) for name in AXES}
+        lookup = {name: {int(code): i for i, code in enumerate(axes[name])} for name in AXES}
+        total = cls(np.zeros(tuple(len(axes[name]) for name in AXES)), axes)
+        for cube in cubes:
+            index = [[lookup[name][int(code)] for code in cube.axes[name]] for name in AXES]
+            # Tranches contiguës (cas courant des cubes partiels) : pas de copie
+            if all(positions == list(range(positions[0], positions[0] + len(positions))) for positions in index):
+                positions = tuple(slice(p[0], p[0] + len(p)) for p in index)
+            else:
+                positions = np.ix_(*index)
+            total.weights[positions] += cube.weights
+            total.counts[positions] += cube.counts
+        return total
+
+    def add(self, year, df):
+        shape = self.weights.shape[1:]
+        year_index = int(np.flatnonzero(self.axes["year"] == year)[0])
+        flat = np.ravel_multi_index(
+            tuple(_axis_index(self.axes[name], df[name].to_numpy()) for name in AXES[1:]), shape)
+        ipondl = np.nan_to_num(df["IPONDL"].to_numpy(dtype=np.float64))
+        self.weights[year_index] += np.bincount(
+            flat, weights=ipondl, minlength=int(np.prod(shape))).reshape(shape)
+        self.counts[year_index] += np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+        return self
+
+    def merge(self, other):
+        if all(np.array_equal(self.axes[name], other.axes[name]) for name in AXES):
+            self.weights += other.weights
+            self.counts += other.counts
+            return self
+        merged = Cube.merged([self, other])
+        self.weights, self.counts, self.axes = merged.weights, merged.counts, merged.axes
+        return self
+
+    def _selector(self, name, value):
+        labels = self.axes[name]
+        if isinstance(value, tuple):
+            start, end = value
+            mask = labels != MISSING
+            if start is not None:
+                mask &= labels >= start
+            if end is not None:
+                mask &= labels <= end
+            return np.flatnonzero(mask)
+        if np.isscalar(value):
+            value = [value]
+        return np.flatnonzero(np.isin(labels, value))
+
+    def slice(self, **filters):
+        # Filtres par code : valeur unique, liste de codes ou intervalle
+        # (début, fin) inclusif, ex. cube.slice(CMBL=3, AEMM=(1950, 1969))
+        # Les filtres les plus sélectifs sont appliqués en premier pour que
+        # chaque copie porte sur le plus petit sous-cube possible
+        selections = sorted(((name, self._selector(name, value)) for name, value in filters.items()),
+                            key=lambda item: len(item[1]) / len(self.axes[item[0]]))
+        weights, counts, axes = self.weights, self.counts, dict(self.axes)
+        for name, index in selections:
+            weights = np.take(weights, index, axis=AXES.index(name))
+            counts = np.take(counts, index, axis=AXES.index(name))
+            axes[name] = axes[name][index]
+        return Cube(weights, axes, counts)
+
+    def rollup(self, *keep, counts=False, **filters):
+        # Somme sur tous les axes absents de keep, après filtrage (nombre
+        # de lignes au lieu des poids si counts)
+        cube = self.slice(**filters)
+        dropped = tuple(i for i, name in enumerate(AXES) if name not in keep)
+        weights = (cube.counts if counts else cube.weights).sum(axis=dropped)
+        order = [name for name in AXES if name in keep]
+        weights = np.moveaxis(weights, [order.index(name) for name in keep], range(len(keep)))
+        return weights, [cube.axes[name] for name in keep]
+
+    def total(self, **filters):
+        return float(self.slice(**filters).weights.sum())
+
+    def count(self, **filters):
+        return int(self.slice(**filters).counts.sum())
+
+    def to_dict(self, outer, inner, counts=False, **filters):
+        # {code outer: {code inner: poids}} au format des fichiers results/,
+        # sans les cases vides ni les cases MISSING
+        weights, (outer_labels, inner_labels) = self.rollup(outer, inner, counts=counts, **filters)
+        return {
+            int(o): {int(i): float(w) for i, w in zip(inner_labels, row) if w != 0 and i != MISSING}
+            for o, row in zip(outer_labels, weights) if o != MISSING
+        }
+
+    def save(self, path=CUBE_PATH, compressed=False):
+        save = np.savez_compressed if compressed else np.savez
+        save(path, weights=self.weights, counts=self.counts, **{f"axis_{name}": self.axes[name] for name in AXES})
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with np.load(path) as data:
+            # Cubes écrits avant counts : nombres de lignes à zéro
+            counts = data["counts"] if "counts" in data.files else None
+            return cls(data["weights"], {name: data[f"axis_{name}"] for name in AXES}, counts)
+
+
+def add_chunk(cube, year, df):
+    with run_report.stage("cube") as entry:
+        entry["rows"] += len(df)
+        return cube.add(year, df)
+
+
+def cube_year(zone, year, years, data_directory="data/regions"):
+    return Cube.empty(years).add(year, read_year(zone, year, data_directory, CUBE_COLUMNS))
+
+
+def cube_from_csv(paths, years, key):
+    # paths : {année: extrait communal}, ex. data/melun/melun_{année}.csv,
+    # colonnes relues depuis le cache colonnes (clé key, ex. "melun")
+    cube = Cube.empty(years)
+    for year, path in paths.items():
+        cube.add(year, load_csv(path, key, year))
+    return cube
+
+
+def build_cube(zones, years, workers=None, data_directory="data/regions"):
+    years = list(years)
+    cube = Cube.empty(years)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(cube_year, zone, year, years, data_directory)
+                   for zone in zones for year in years]
+        for future in futures:
+            cube.merge(future.result())
+    return cube
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cube pondéré année x CMBL x TYPL x AEMM x REGION")
+    parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    parser.add_argument("--first-year", type=int, default=FIRST_YEAR)
+    parser.add_argument("--last-year", type=int, default=LAST_YEAR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data-directory", default="data/regions")
+    parser.add_argument("--output", default=CUBE_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    build_cube(args.zones, range(args.first_year, args.last_year + 1),
+               args.workers, args.data_directory).save(args.output)
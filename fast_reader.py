@@ -0,0 +1,205 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import run_report
+
+# Lecteur dédié aux fichiers détail FD_LOGEMT : seules les colonnes projetées
+# sont découpées, directement en tableaux numpy. Le texte est traité par blocs
+# alignés sur les fins de ligne ; les séparateurs ';' de chaque ligne donnent
+# les bornes des champs, puis les entiers et les décimaux (virgule ou point)
+# sont convertis de façon vectorisée. Les codes en lettres ('Z', 'ZZ', 'X',
+# ...) deviennent NaN. Un bloc de forme irrégulière (guillemets, nombre
+# de champs variable) repasse par pd.read_csv. Avec des types compacts
+# (mod_logemt.compact_dtypes), les codes entiers sont lus directement en
+# petits entiers, MISSING_CODE pour les codes en lettres et les champs
+# vides (les codes hors champ numériques, AEMM 0000, gardent leur valeur).
+
+BLOCK_SIZE = 1024 * 1024
+
+MISSING_CODE = -1
+
+SEMICOLON, NEWLINE, CARRIAGE_RETURN = ord(';'), ord('\n'), ord('\r')
+COMMA, DOT, ZERO = ord(','), ord('.'), ord('0')
+
+NAN_BYTES = np.frombuffer(b'nan', dtype=np.uint8)
+PADDING = bytes(64)
+
+
+def iter_blocks(f, block_size=BLOCK_SIZE):
+    # Blocs de lignes complètes : le reste après le dernier '\n' est reporté
+    remainder = b''
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            remainder = data
+            continue
+        remainder = data[cut:]
+        yield data[:cut]
+    if remainder.strip():
+        yield remainder + b'\n'
+
+
+def _field_matrix(buf, starts, widths, max_width):
+    # Octets de chaque champ, complétés par des 0 : tableau (lignes, largeur).
+    # buf se termine par PADDING, la fenêtre ne déborde donc jamais.
+    matrix = np.lib.stride_tricks.sliding_window_view(buf, max_width)[starts]
+    matrix[np.arange(max_width) >= widths[:, None]] = 0
+    return matrix
+
+
+def _python_float(raw):
+    try:
+        return float(raw.rstrip(b'\0'))
+    except ValueError:
+        return np.nan
+
+
+def _parse_numbers(buf, starts, widths):
+    first = buf[starts]
+    # Champ vide ou code en lettres ('Z', 'ZZ', 'X', ...) : valeur manquante
+    missing = (widths == 0) | ((first >= ord('A')) & (first <= ord('Z')))
+
+    if widths.max(initial=1) == 1:
+        # Codes à un caractère (CMBL, TYPL, ...) : pas de matrice
+        digits = first.astype(np.int8) - ZERO
+        return np.where(~missing & (digits >= 0) & (digits <= 9), digits, np.nan)
+
+    # Les octets des champs, virgule décimale remplacée par un point, sont
+    # convertis d'un bloc par numpy (même arrondi que float())
+    max_width = int(max(widths.max(initial=1), len(NAN_BYTES)))
+    matrix = _field_matrix(buf, starts, widths, max_width)
+    matrix[matrix == COMMA] = DOT
+    if missing.any():
+        matrix[missing] = 0
+        matrix[np.ix_(missing, np.arange(len(NAN_BYTES)))] = NAN_BYTES
+    fields = matrix.view(f'S{max_width}').ravel()
+    try:
+        return fields.astype(np.float64)
+    except ValueError:
+        return np.array([_python_float(field) for field in fields])
+
+
+def _parse_integers(buf, starts, widths, dtype):
+    # Chiffres du champ lus en base 10 ; champ vide, code en lettres ou
+    # valeur hors du type -> MISSING_CODE
+    max_width = int(widths.max(initial=1))
+    if max_width == 1:
+        values = buf[starts].astype(np.int64) - ZERO
+        valid = (widths == 1) & (values >= 0) & (values <= 9)
+    else:
+        digits = _field_matrix(buf, starts, widths, max_width).astype(np.int64) - ZERO
+        inside = np.arange(max_width) < widths[:, None]
+        valid = (widths > 0) & (widths <= 18) & \
+            ((digits >= 0) & (digits <= 9) | ~inside).all(axis=1)
+        powers = 10 ** np.clip(widths[:, None] - 1 - np.arange(max_width), 0, 18)
+        values = (np.where(inside, digits, 0) * powers).sum(axis=1)
+    valid &= values <= np.iinfo(dtype).max
+    return np.where(valid, values, MISSING_CODE).astype(dtype)
+
+
+def compact_values(values, dtype):
+    # Valeurs float64 (NaN pour les manquantes) vers le type compact
+    values = np.asarray(values, dtype=np.float64)
+    if np.issubdtype(dtype, np.floating):
+        return values.astype(dtype)
+    valid = ~np.isnan(values) & (values >= 0) & (values <= np.iinfo(dtype).max)
+    return np.where(valid, values, MISSING_CODE).astype(dtype)
+
+
+def _parse_strings(buf, starts, widths):
+    max_width = int(max(widths.max(initial=1), 1))
+    matrix = np.ascontiguousarray(_field_matrix(buf, starts, widths, max_width))
+    return matrix.view(f'S{max_width}').ravel().astype(str)
+
+
+def parse_block(block, column_positions, n_columns, string_columns=(), dtypes=None):
+    buf = np.frombuffer(block + PADDING, dtype=np.uint8)
+    # Un seul parcours pour les ';' et les '\n' : sur un bloc régulier,
+    # chaque ligne compte exactement n_columns bornes dont la dernière est '\n'
+    is_newline = buf == NEWLINE
+    bounds = np.flatnonzero((buf == SEMICOLON) | is_newline)
+    if len(bounds) % n_columns or b'"' in block:
+        return None
+    bounds = bounds.reshape(-1, n_columns)
+    newlines = bounds[:, -1]
+    if len(newlines) == 0 or np.count_nonzero(is_newline) != len(newlines) \
+            or not is_newline[newlines].all():
+        return None
+
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_ends = newlines - (buf[np.maximum(newlines - 1, 0)] == CARRIAGE_RETURN)
+    separators = bounds[:, :-1]
+
+    columns = {}
+    with run_report.stage("conversion") as entry:
+        for name, position in column_positions.items():
+            starts = line_starts if position == 0 else separators[:, position - 1] + 1
+            ends = line_ends if position == n_columns - 1 else separators[:, position]
+            widths = ends - starts
+            if widths.max(initial=0) > len(PADDING):
+                return None
+            dtype = None if dtypes is None else dtypes.get(name)
+            if name in string_columns:
+                columns[name] = _parse_strings(buf, starts, widths)
+            elif dtype is not None and np.issubdtype(dtype, np.integer):
+                columns[name] = _parse_integers(buf, starts, widths, dtype)
+            elif dtype is not None:
+                columns[name] = _parse_numbers(buf, starts, widths).astype(dtype)
+            else:
+                columns[name] = _parse_numbers(buf, starts, widths)
+        entry["rows"] += len(newlines)
+    return columns
+
+
+def _fallback(header, block, columns, string_columns, dtypes=None):
+    df = pd.read_csv(io.BytesIO(header + block), sep=';', usecols=columns,
+                     dtype={c: str for c in columns if c in string_columns})
+    for column in columns:
+        if column not in string_columns:
+            values = df[column]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values.str.replace(",", "."), errors="coerce")
+            df[column] = values.astype(np.float64)
+            if dtypes is not None and column in dtypes:
+                df[column] = compact_values(df[column], dtypes[column])
+    return {column: df[column].to_numpy() for column in columns}
+
+
+def iter_projected(f, columns, string_columns=(), block_size=BLOCK_SIZE, dtypes=None):
+    # Un DataFrame par bloc de BLOCK_SIZE octets de texte ; dtypes :
+    # {colonne: type numpy compact}, les autres colonnes en float64
+    header = f.readline()
+    names = header.decode('latin-1').rstrip('\r\n').split(';')
+    missing = [column for column in columns if column not in names]
+    if missing:
+        raise ValueError(f"Colonnes absentes du fichier : {missing}")
+    column_positions = {column: names.index(column) for column in columns}
+    if dtypes is not None:
+        dtypes = {column: np.dtype(dtype) for column, dtype in dtypes.items()}
+
+    for block in iter_blocks(f, block_size):
+        # analyse = découpage des champs + conversion (ou read_csv en repli)
+        with run_report.stage("analyse") as entry:
+            parsed = parse_block(block, column_positions, len(names), string_columns, dtypes)
+            if parsed is None:
+                with run_report.stage("read_csv"):
+                    parsed = _fallback(header, block, columns, string_columns, dtypes)
+            frame = pd.DataFrame(parsed, columns=columns, copy=False)
+            entry["rows"] += len(frame)
+            entry["bytes"] += len(block)
+        yield frame
+
+
+def read_projected(f, columns, string_columns=(), block_size=BLOCK_SIZE, dtypes=None):
+    frames = list(iter_projected(f, columns, string_columns, block_size, dtypes))
+    if not frames:
+        return pd.DataFrame({column: np.array([], dtype=np.float64) for column in columns})
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,142 @@
+import argparse
+import glob
+import os
+import zipfile
+
+import numpy as np
+
+import run_report
+from aggregation import FioulAggregate, aggregate_fioul
+from fast_reader import BLOCK_SIZE, compact_values, iter_projected, read_projected
+from mod_logemt import compact_dtypes
+
+# REGION pour les cubes partiels du générateur (totaux par régions, cf. cube.py)
+COLUMNS = ["CMBL", "IPONDL", "AEMM", "TYPL", "REGION"]
+
+# Codes géographiques gardés en texte (ex. 2A004 pour la Corse)
+STRING_COLUMNS = {"COMMUNE", "ARM", "IRIS", "TRIRIS"}
+
+# Découpage en zones des fichiers détail (codes REGION de l'Insee, cf. readme)
+ZONES = {
+    "A": [11],
+    "B": [24, 27, 28, 32],
+    "C": [44, 52, 53],
+    "D": [75, 76],
+    "E": [84, 93, 94, 1, 2, 3, 4],
+}
+
+# Mode compact : codes en petits entiers (type tiré du dictionnaire
+# MOD_LOGEMT du millésime, cf. mod_logemt.py), MISSING_CODE (fast_reader)
+# pour les valeurs manquantes, et poids IPONDL en float32. L'erreur relative
+# sur chaque poids reste sous 2**-24 (6e-8) ; les sommes sont toujours
+# faites en float64.
+
+# Mémoire de travail du lecteur par octet de texte d'un bloc (masques,
+# positions des séparateurs, colonnes converties), mesurée avec tracemalloc
+# (environ 9) puis arrondie
+PARSE_BYTES_PER_TEXT_BYTE = 10
+# Plus petit budget tenable : un bloc de BLOCK_SIZE octets de texte
+MIN_MEMORY_BUDGET_MB = BLOCK_SIZE * PARSE_BYTES_PER_TEXT_BYTE / (1024 * 1024)
+
+
+def zip_path(zone, year, data_directory="data/regions"):
+    return f"{data_directory}/{zone}/{year}.zip"
+
+
+def available_years(zone, data_directory="data/regions"):
+    paths = glob.glob(f"{data_directory}/{zone}/*.zip")
+    stems = (os.path.splitext(os.path.basename(path))[0] for path in paths)
+    return sorted(int(stem) for stem in stems if stem.isdigit())
+
+
+def member_name(zone, year):
+    if year < 2016:
+        return f"FD_LOGEMTZ{zone}_{year}.txt"
+    return f"FD_LOGEMTZ{zone}_{year}.csv"
+
+
+def header_columns(zone, year, data_directory="data/regions"):
+    # Les colonnes varient selon le millésime (pas d'ACHL en 2010, ...)
+    with zipfile.ZipFile(zip_path(zone, year, data_directory), 'r') as z:
+        with z.open(member_name(zone, year)) as f:
+            return f.readline().decode('latin-1').rstrip('\r\n').split(';')
+
+
+def compact_columns(df, year=None):
+    # DataFrame déjà lu en float64 vers les types compacts
+    for column, dtype in compact_dtypes(df.columns, year).items():
+        df[column] = compact_values(df[column], np.dtype(dtype))
+    return df
+
+
+def memory_footprint(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def read_year(zone, year, data_directory="data/regions", columns=COLUMNS, compact=False):
+    # Lecteur projeté : seules les colonnes demandées sont découpées et
+    # IPONDL est lu directement avec sa virgule décimale. En mode compact,
+    # chaque colonne est lue directement dans son type compact.
+    dtypes = compact_dtypes(columns, year) if compact else None
+    with zipfile.ZipFile(zip_path(zone, year, data_directory), 'r') as z:
+        with z.open(member_name(zone, year)) as member:
+            f = run_report.timed_file(member, "decompression")
+            df = read_projected(f, columns, STRING_COLUMNS, dtypes=dtypes)
+    if compact and len(df) == 0:
+        return compact_columns(df, year)
+    return df
+
+
+def read_extract(path, year=None, columns=COLUMNS, compact=False):
+    # Extraits déjà décompressés (data/melun/melun_{year}.csv, ...) : même
+    # lecteur que les zips, virgule ou point décimal
+    dtypes = compact_dtypes(columns, year) if compact else None
+    with open(path, 'rb') as f:
+        df = read_projected(f, columns, STRING_COLUMNS, dtypes=dtypes)
+    if compact and len(df) == 0:
+        return compact_columns(df, year)
+    return df
+
+
+def block_size_for_budget(memory_budget_mb):
+    # Un budget sous le plancher serait dépassé sans le dire : refusé
+    if memory_budget_mb < MIN_MEMORY_BUDGET_MB:
+        raise ValueError(f"Budget mémoire de {memory_budget_mb:g} Mo sous le minimum de "
+                         f"{MIN_MEMORY_BUDGET_MB:g} Mo (un bloc de {BLOCK_SIZE // 1024} Ko de texte)")
+    return int(memory_budget_mb * 1024 * 1024 // PARSE_BYTES_PER_TEXT_BYTE)
+
+
+def memory_budget(text):
+    # Type argparse des options --memory-budget-mb
+    try:
+        value = float(text)
+        block_size_for_budget(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+
+def iter_year_chunks(zone, year, block_size=BLOCK_SIZE, data_directory="data/regions", columns=COLUMNS):
+    # Le membre du zip est décompressé au fil de la lecture : seul un bloc
+    # de block_size octets de texte est présent en mémoire à la fois
+    with zipfile.ZipFile(zip_path(zone, year, data_directory), 'r') as z:
+        with z.open(member_name(zone, year)) as member:
+            yield from iter_projected(run_report.timed_file(member, "decompression"),
+                                      columns, STRING_COLUMNS, block_size)
+
+
+def aggregate_chunks(chunks):
+    fioul = FioulAggregate()
+    for chunk in chunks:
+        aggregate_fioul(chunk, fioul)
+    return fioul
+
+
+def aggregate_year_streaming(zone, year, memory_budget_mb=256, data_directory="data/regions"):
+    block_size = block_size_for_budget(memory_budget_mb)
+    return aggregate_chunks(iter_year_chunks(zone, year, block_size, data_directory))
+
+
+def iter_member_chunks(member, block_size=BLOCK_SIZE, columns=COLUMNS):
+    # Membre déjà ouvert (ex. prefetch.PrefetchedMember), lu bloc par bloc
+    yield from iter_projected(run_report.timed_file(member, "decompression"), columns, STRING_COLUMNS, block_size)
@@ -0,0 +1,196 @@
+import argparse
+import array
+import ast
+import bisect
+import json
+import os
+import sys
+
+from mod_logemt import labels
+
+# Point d'entrée léger : les résumés sont lus directement dans les résultats
+# précalculés (store .npy décodé sans numpy, sinon fichiers JSON) ; pandas,
+# numpy et matplotlib ne sont importés que par les sous-commandes qui
+# délèguent à un script (graphiques, generer, ingest, ...).
+
+RESULTS_DIRECTORY = "results"
+
+# Sous-commande -> script lancé avec les arguments restants
+SCRIPTS = {
+    "generer": "region_data_generator",
+    "graphiques": "region_data_reader",
+    "cache": "columnar_cache",
+    "blocs": "block_archive",
+    "cube": "cube",
+    "rollup": "rollup",
+    "base": "logements_db",
+    "communes": "csv_commune_filter",
+    "toutes-communes": "commune_aggregates",
+    "cohortes": "cohorts",
+    "synthese": "synthetic_logemt",
+    "benchmark": "benchmark",
+    "service": "aggregate_service",
+}
+
+NPY_TYPECODES = {"<f8": "d", "<i8": "q", "|b1": "b"}
+
+
+def read_npy(path):
+    # (forme, valeurs à plat) d'un .npy float64, int64 ou booléen
+    with open(path, 'rb') as f:
+        if f.read(6) != b'\x93NUMPY':
+            raise ValueError(f"{path} n'est pas un fichier .npy")
+        major = f.read(2)[0]
+        header_length = int.from_bytes(f.read(2 if major == 1 else 4), 'little')
+        header = ast.literal_eval(f.read(header_length).decode('latin-1'))
+        if header["fortran_order"] or header["descr"] not in NPY_TYPECODES:
+            raise ValueError(f"{path} : format non géré ({header['descr']})")
+        values = array.array(NPY_TYPECODES[header["descr"]])
+        values.frombytes(f.read())
+    return header["shape"], values
+
+
+def _nested(store, labels, weights, present):
+    (n_years, n_labels), values = read_npy(f"{store}/{weights}.npy")
+    _, mask = read_npy(f"{store}/{present}.npy")
+    _, codes = read_npy(f"{store}/{labels}.npy")
+    _, years = read_npy(f"{store}/years.npy")
+    return {years[row]: {codes[col]: values[row * n_labels + col]
+                         for col in range(n_labels) if mask[row * n_labels + col]}
+            for row in range(n_years)}
+
+
+def load_table(zone, name, results_directory=RESULTS_DIRECTORY):
+    # name : 'par_type_logement' ou 'par_annee_emmenagement' ; {année: {code: poids}}
+    store = f"{results_directory}/{zone}/store"
+    if os.path.exists(f"{store}/meta.json"):
+        axis = "typl" if name == "par_type_logement" else "aemm"
+        return _nested(store, axis, name, f"present_{axis}")
+    with open(f"{results_directory}/{zone}/fioul_{name}.json", 'r', encoding='utf-8') as f:
+        # Codes triés, comme dans le store
+        return {int(k): dict(sorted((int(ki), vi) for ki, vi in v.items())) for k, v in json.load(f).items()}
+
+
+def print_summary(zone, results_directory=RESULTS_DIRECTORY, year=None):
+    fioul_par_type_logement = load_table(zone, "par_type_logement", results_directory)
+    current_analysis_year = year or max(fioul_par_type_logement)
+    types_logements = labels("TYPL", current_analysis_year)
+
+    print("\n" + "=" * 60)
+    print(f"RÉSUMÉ DES ANALYSES - ZONE {zone}")
+    print("=" * 60)
+
+    total_fioul_last = sum(fioul_par_type_logement[current_analysis_year].values(
+    )) if current_analysis_year in fioul_par_type_logement else 0
+    print(f"Nombre total de logements au fioul en {current_analysis_year} : {total_fioul_last:.0f}")
+
+    if current_analysis_year in fioul_par_type_logement:
+        print(f"\nRépartition par type de logement en {current_analysis_year} :")
+        for type_log, count in fioul_par_type_logement[current_analysis_year].items():
+            type_name = types_logements.get(type_log, f"Type {type_log}")
+            pourcentage = (count / total_fioul_last *
+                           100) if total_fioul_last > 0 else 0
+            print(f"  {type_name}: {count:.0f} logements ({pourcentage:.1f}%)")
+
+
+# Store converti des fichiers JSON (results_store.py --to-store), résultats
+# d'une commune (commune_aggregates.py export) ou fichiers JSON seuls : TYPL
+# et AEMM chacun par année, sans leur croisement
+NO_CROSS_TAB = ("Résultats sans croisement TYPL x AEMM (fichiers JSON ou commune exportée) : "
+                "--typl et --aemm ne se combinent pas, relancer region_data_generator.py pour une zone")
+
+
+def aemm_total(store, year=None, typl=None, aemm=(None, None)):
+    # Intervalle AEMM inclusif lu dans les sommes cumulées du store
+    # (cumul_aemm, cf. results_store.py) : deux valeurs par type retenu
+    (_, n_aemm, n_columns), cumul = read_npy(f"{store}/cumul_aemm.npy")
+    if typl is not None and n_columns == 1:
+        raise ValueError(NO_CROSS_TAB)
+    _, years = read_npy(f"{store}/years.npy")
+    _, codes = read_npy(f"{store}/aemm.npy")
+    _, types = read_npy(f"{store}/typl.npy")
+    year = year or max(years)
+    if year not in years:
+        return 0.0
+    start, end = aemm
+    left = 0 if start is None else bisect.bisect_left(codes, start)
+    right = max(left, len(codes) if end is None else bisect.bisect_right(codes, end))
+    columns = [0] if typl is None else [1 + i for i, code in enumerate(types) if code in typl]
+    row = years.index(year) * n_aemm * n_columns
+    return sum(cumul[row + right * n_columns + c] - cumul[row + left * n_columns + c] for c in columns)
+
+
+def total(zone, year=None, typl=None, aemm=None, results_directory=RESULTS_DIRECTORY):
+    # Logements au fioul pondérés d'une année d'enquête (la dernière par
+    # défaut), restreints à des types TYPL ou à un intervalle AEMM inclusif
+    store = f"{results_directory}/{zone}/store"
+    if aemm is not None and os.path.exists(f"{store}/cumul_aemm.npy"):
+        return aemm_total(store, year, typl, aemm)
+    if typl is not None and aemm is not None:
+        raise ValueError(NO_CROSS_TAB)
+    table = load_table(zone, "par_annee_emmenagement" if aemm is not None else "par_type_logement",
+                       results_directory)
+    values = table.get(year or max(table), {})
+    if typl is not None:
+        return sum(w for code, w in values.items() if code in typl)
+    if aemm is not None:
+        start, end = aemm
+        return sum(w for code, w in values.items() if start <= code <= end)
+    return sum(values.values())
+
+
+def available_zones(results_directory=RESULTS_DIRECTORY):
+    if not os.path.isdir(results_directory):
+        return []
+    return sorted(zone for zone in os.listdir(results_directory)
+                  if os.path.exists(f"{results_directory}/{zone}/store/meta.json")
+                  or os.path.exists(f"{results_directory}/{zone}/fioul_par_type_logement.json"))
+
+
+def run_script(module, arguments):
+    import runpy
+    sys.argv = [f"{module}.py"] + arguments
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def parse_interval(text):
+    start, end = text.split(":")
+    return int(start), int(end)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Résumés des logements au fioul et lancement des scripts")
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = subparsers.add_parser("resume", help="résumé par zone (dernière année par défaut)")
+    summary_parser.add_argument("zones", nargs="*")
+    summary_parser.add_argument("--year", type=int, default=None)
+
+    total_parser = subparsers.add_parser("total", help="un seul nombre, pour les scripts et alertes")
+    total_parser.add_argument("zone")
+    total_parser.add_argument("--year", type=int, default=None)
+    total_parser.add_argument("--typl", type=int, nargs="+", default=None)
+    total_parser.add_argument("--aemm", type=parse_interval, default=None, help="début:fin inclusif")
+
+    for command, module in SCRIPTS.items():
+        subparsers.add_parser(command, help=f"python {module}.py ...", add_help=False)
+    # Les options inconnues ne sont transmises qu'aux scripts lancés
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command not in SCRIPTS:
+        parser.error(f"arguments non reconnus : {' '.join(rest)}")
+    return args, rest
+
+
+if __name__ == "__main__":
+    args, rest = parse_args(sys.argv[1:])
+    if args.command in SCRIPTS:
+        run_script(SCRIPTS[args.command], rest)
+    elif args.command == "resume":
+        for zone in args.zones or available_zones(args.results_directory):
+            print_summary(zone, args.results_directory, args.year)
+    else:
+        try:
+            print(f"{total(args.zone, args.year, args.typl, args.aemm, args.results_directory):.0f}")
+        except ValueError as error:
+            raise SystemExit(f"fioul.py total : {error}")
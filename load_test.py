@@ -1,27 +1,20 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
 import json
 import os
 
+from aggregation import aggregate_fioul
+from cohorts import CohortMatrix
+from cube import MISSING, Cube
+from columnar_cache import load_csv
+from results_store import ZoneResults, decennies
+import mod_logemt
+
 plt.style.use('seaborn-v0_8')
 
-# Types de combustibles
-COMBUSTIBLES = {
-    1: "Chauffage urbain",
-    2: "Gaz de ville/réseau",
-    3: "Fioul (mazout)",
-    4: "Électricité",
-    5: "Gaz bouteille/citerne",
-    6: "Autre"
-}
-
-# Types de logements
-TYPES_LOGEMENTS = {
-    1: "Maison individuelle",
-    2: "Appartement",
-    3: "Autre"
-}
+# Types de logements et combustibles (libellés du dictionnaire data/MOD_LOGEMT_*.txt)
+TYPES_LOGEMENTS = mod_logemt.labels("TYPL")
+COMBUSTIBLES = mod_logemt.labels("CMBL")
 
 directory = "data/melun/"
 
@@ -32,47 +25,23 @@ directory = "data/melun/"
 fioul_par_annee_emmenagement = {}
 fioul_par_type_logement = {}
 fioul_par_annee_et_type = {}
+# Cube pondéré année x CMBL x TYPL x AEMM x REGION, rempli avec les mêmes
+# colonnes : toute autre projection (gaz, électricité, ...) se lit ensuite
+# sans relire les fichiers
+cube = Cube.empty(range(2010, 2022))
 
 for year in range(2010, 2022):
     file = f"{directory}/melun_{year}.csv"
-    df = pd.read_csv(file, sep=';', usecols=["CMBL", "IPONDL", "AEMM", "TYPL"])
-
-    # Conversion en numérique
-    df["CMBL"] = pd.to_numeric(df["CMBL"], errors="coerce")
-    if pd.api.types.is_string_dtype(df["IPONDL"].dtypes):
-        df["IPONDL"] = df["IPONDL"].str.replace(",", ".")
-    df["IPONDL"] = pd.to_numeric(df["IPONDL"], errors="coerce")
-    df["AEMM"] = pd.to_numeric(df["AEMM"], errors="coerce")
-    df["TYPL"] = pd.to_numeric(df["TYPL"], errors="coerce")
-
-    # Filtrer uniquement les logements au fioul
-    df_fioul = df[df["CMBL"] == 3].copy()
-
-    # Logements au fioul par année d'emménagement
-    fioul_par_annee_emmenagement[year] = {}
-    for annee_emm in df_fioul["AEMM"].unique():
-        if not pd.isna(annee_emm):
-            count = (df_fioul[df_fioul["AEMM"] == annee_emm]["IPONDL"]).sum()
-            fioul_par_annee_emmenagement[year][int(annee_emm)] = count
-
-    # Logements au fioul par type de logement
-    fioul_par_type_logement[year] = {}
-    for type_log in df_fioul["TYPL"].unique():
-        if not pd.isna(type_log):
-            count = (df_fioul[df_fioul["TYPL"] == type_log]["IPONDL"]).sum()
-            fioul_par_type_logement[year][int(type_log)] = count
-
-    # Logements au fioul par année d'emménagement ET type de logement
-    fioul_par_annee_et_type[year] = {}
-    for annee_emm in df_fioul["AEMM"].unique():
-        if not pd.isna(annee_emm):
-            fioul_par_annee_et_type[year][int(annee_emm)] = {}
-            for type_log in df_fioul["TYPL"].unique():
-                if not pd.isna(type_log):
-                    count = ((df_fioul["AEMM"] == annee_emm) &
-                             (df_fioul["TYPL"] == type_log) * df_fioul["IPONDL"]).sum()
-                    fioul_par_annee_et_type[year][int(
-                        annee_emm)][int(type_log)] = count
+    # Colonnes typées relues depuis le cache (créé au premier passage)
+    df = load_csv(file, "melun", year)
+
+    # Logements au fioul par année d'emménagement, par type de logement
+    # et par année d'emménagement ET type de logement, en une seule passe
+    fioul = aggregate_fioul(df)
+    fioul_par_annee_emmenagement[year] = fioul.par_annee_emmenagement()
+    fioul_par_type_logement[year] = fioul.par_type_logement()
+    fioul_par_annee_et_type[year] = fioul.par_annee_et_type()
+    cube.add(year, df)
 
 # Sauvegarde des données
 os.makedirs('results', exist_ok=True)
@@ -91,23 +60,17 @@ print("=" * 60)
 print("LOGEMENTS AU FIOUL PAR ANNÉE D'EMMÉNAGEMENT")
 print("=" * 60)
 
-# Préparation des données pour le graphique cumulatif
-all_annees_emm = set()
-for year_data in fioul_par_annee_emmenagement.values():
-    all_annees_emm.update(year_data.keys())
-all_annees_emm = sorted([a for a in all_annees_emm if a >= 1950])
-
-# Création du DataFrame cumulatif
-df_fioul_emm_cumul = pd.DataFrame(index=all_annees_emm)
-for year in range(2010, 2022):
-    year_data = fioul_par_annee_emmenagement.get(year, {})
-    counts = [year_data.get(annee, 0) for annee in all_annees_emm]
-    df_fioul_emm_cumul[year] = counts
+# Matrice année d'enquête x année d'emménagement (cohortes depuis 1950)
+results = ZoneResults.from_dicts(fioul_par_annee_emmenagement, fioul_par_type_logement)
+cohorts = CohortMatrix.from_results([results], ["melun"])
+for y0, y1, rate in zip(cohorts.years[:-1], cohorts.years[1:], cohorts.stock_attrition()[0]):
+    print(f"Attrition des cohortes installées {y0}-{y1} : {rate:.1%}")
+cohort_matrix = cohorts.since(1950).on_years(range(2010, 2022))
 
 # Graphique 1 : Heatmap des logements au fioul par année d'emménagement
 plt.figure(figsize=(16, 10))
-im = plt.imshow(df_fioul_emm_cumul.T, cmap='YlOrRd', aspect='auto',
-                extent=[min(all_annees_emm), max(all_annees_emm), 2021, 2010])
+im = plt.imshow(cohort_matrix.matrix("melun"), cmap='YlOrRd', aspect='auto',
+                extent=[min(cohort_matrix.aemm), max(cohort_matrix.aemm), 2021, 2010])
 plt.colorbar(label='Nombre de logements au fioul (pondéré)')
 plt.xlabel('Année d\'emménagement')
 plt.ylabel('Année de l\'enquête')
@@ -137,23 +100,14 @@ if 2021 in fioul_par_annee_emmenagement:
     plt.show()
 
 # Graphique 3 : Évolution des logements au fioul par période d'emménagement
-# Regroupement par décennies
-decennies = ['1950-1959', '1960-1969', '1970-1979', '1980-1989',
-             '1990-1999', '2000-2009', '2010-2019', '2020-2021']
-
-fioul_par_decennie = {dec: [] for dec in decennies}
-years_survey = list(range(2010, 2022))
-
-for year in years_survey:
-    data = fioul_par_annee_emmenagement.get(year, {})
-    for decennie in decennies:
-        start, end = map(int, decennie.split('-'))
-        total_decennie = sum(data.get(annee, 0) for annee in data.keys()
-                             if start <= annee <= end)
-        fioul_par_decennie[decennie].append(total_decennie)
+# Regroupement par décennies, lu dans les sommes cumulées le long de l'AEMM
+starts, ends = decennies(results)
+decennies_emm = [f'{start}-{end}' for start, end in zip(starts, ends)]
+fioul_par_decennie = dict(zip(decennies_emm, results.aemm_ranges(starts, ends).T))
+years_survey = [int(year) for year in results.years]
 
 plt.figure(figsize=(14, 8))
-for decennie in decennies:
+for decennie in decennies_emm:
     plt.plot(years_survey, fioul_par_decennie[decennie],
              marker='o', linewidth=2, label=decennie)
 
@@ -175,18 +129,15 @@ print("\n" + "=" * 60)
 print("LOGEMENTS AU FIOUL PAR TYPE DE LOGEMENT")
 print("=" * 60)
 
-# Préparation des données
-fioul_par_type_combined = {}
-for type_log in TYPES_LOGEMENTS.keys():
-    fioul_par_type_combined[type_log] = []
-    for year in range(2010, 2022):
-        data = fioul_par_type_logement.get(year, {})
-        fioul_par_type_combined[type_log].append(data.get(type_log, 0))
+# Logements au fioul par type (lignes) et par année (colonnes)
+weights, (types_cube, _) = cube.rollup("TYPL", "year", CMBL=3)
+fioul_par_type_combined = {int(type_log): counts.tolist() for type_log, counts in zip(types_cube, weights)
+                           if type_log != MISSING and counts.any()}
 
 # Graphique 4 : Évolution des logements au fioul par type de logement
 plt.figure(figsize=(12, 8))
 for type_log, counts in fioul_par_type_combined.items():
-    type_name = TYPES_LOGEMENTS[type_log]
+    type_name = TYPES_LOGEMENTS.get(type_log, f"Type {type_log}")
     plt.plot(range(2010, 2022), counts, marker='o', linewidth=2,
              label=type_name, markersize=6)
 
@@ -229,7 +180,7 @@ if 2021 in fioul_par_type_logement:
 # Graphique 6 : Stacked area - Évolution cumulée par type
 df_fioul_types = pd.DataFrame(fioul_par_type_combined)
 df_fioul_types.index = range(2010, 2022)
-df_fioul_types.columns = [TYPES_LOGEMENTS[col]
+df_fioul_types.columns = [TYPES_LOGEMENTS.get(col, f"Type {col}")
                           for col in df_fioul_types.columns]
 
 plt.figure(figsize=(14, 8))
@@ -261,6 +212,10 @@ if 2021 in fioul_par_type_logement:
                        100) if total_fioul_2021 > 0 else 0
         print(f"  {type_name}: {count:.0f} logements ({pourcentage:.1f}%)")
 
+print("\nLogements par combustible en 2021 (cube) :")
+for code, count in cube.to_dict("year", "CMBL", year=2021).get(2021, {}).items():
+    print(f"  {COMBUSTIBLES.get(code, f'Combustible {code}')}: {count:.0f} logements")
+
 print("\nDonnées sauvegardées dans le dossier 'results/' :")
 print("- fioul_par_annee_emmenagement.json")
 print("- fioul_par_type_logement.json")
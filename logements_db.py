@@ -0,0 +1,252 @@
+import argparse
+import os
+import sqlite3
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import source_signature
+from fast_reader import iter_projected
+from fd_logemt import STRING_COLUMNS, ZONES, available_years, header_columns, member_name, zip_path
+
+DATABASE_PATH = "cache/logements.sqlite"
+
+INGEST_COLUMNS = ["COMMUNE", "REGION", "CMBL", "TYPL", "AEMM", "ACHL", "IPONDL"]
+
+# ACHL est gardé en texte : codes numériques (111, 211, ...) jusqu'en 2016,
+# codes en lettres (A11, B11, C100, C2019, ...) ensuite. Les millésimes 2010
+# à 2012 n'ont pas ACHL (ACHLR3 seulement, trop grossier) : NULL.
+INGEST_STRING_COLUMNS = STRING_COLUMNS | {"ACHL"}
+
+# Année de fin de la période d'achèvement, commune aux deux nomenclatures
+# ACHL : ACHL_FIN <= 1970 pour « construit avant 1971 »
+ACHL_FIN = {
+    "111": 1918, "A11": 1918,
+    "112": 1945, "A12": 1945,
+    "211": 1970, "B11": 1970,
+    "212": 1990, "B12": 1990,
+    "311": 2005, "C100": 2005,
+}
+
+INDEXED_COLUMNS = ["COMMUNE", "DEPT", "REGION", "CMBL", "TYPL", "ACHL_FIN"]
+NUMERIC_COLUMNS = {"year", "REGION", "CMBL", "TYPL", "AEMM", "ACHL_FIN"}
+
+INSERT_BATCH_SIZE = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logements (
+    zone TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    COMMUNE TEXT,
+    DEPT TEXT,
+    REGION INTEGER,
+    CMBL INTEGER,
+    TYPL INTEGER,
+    AEMM INTEGER,
+    ACHL TEXT,
+    ACHL_FIN INTEGER,
+    IPONDL REAL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    zone TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    source TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    rows INTEGER,
+    PRIMARY KEY (zone, year)
+);
+CREATE INDEX IF NOT EXISTS logements_zone_year ON logements (zone, year);
+"""
+
+
+def connect(path=DATABASE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _achl_fin_code(code):
+    # Codes détaillés : 31x (2006-2012) et 32x (2013-...) jusqu'en 2016,
+    # C1xx (2006-...) et C20xx ensuite ; -1 pour un code inconnu ou absent
+    if code in ACHL_FIN:
+        return ACHL_FIN[code]
+    for prefix, offset in (("C20", 2000), ("C1", 2000), ("31", 2004), ("32", 2008)):
+        suffix = code[len(prefix):]
+        if code.startswith(prefix) and suffix.isdigit():
+            return offset + int(suffix)
+    return -1
+
+
+def achl_fin(achl):
+    # Quelques dizaines de codes distincts : conversion par code puis gather
+    codes, inverse = np.unique(achl, return_inverse=True)
+    return np.array([_achl_fin_code(code) for code in codes], dtype=np.int64)[inverse]
+
+
+def departement(commune):
+    # Deux premiers caractères du code commune, trois pour les DOM (97x)
+    return np.where(np.char.startswith(commune, "97"), commune.astype("U3"), commune.astype("U2"))
+
+
+def year_rows(zone, year, data_directory="data/regions"):
+    # Lignes (zone, year, COMMUNE, DEPT, ...) de l'année par blocs, prêtes
+    # pour executemany ; une colonne absente du millésime vaut NULL
+    names = header_columns(zone, year, data_directory)
+    columns = [column for column in INGEST_COLUMNS if column in names]
+    with zipfile.ZipFile(zip_path(zone, year, data_directory), 'r') as z:
+        with z.open(member_name(zone, year)) as f:
+            for block in iter_projected(f, columns, INGEST_STRING_COLUMNS):
+                n = len(block)
+                values = {column: block[column].to_numpy() if column in block else np.full(n, None)
+                          for column in INGEST_COLUMNS}
+                commune = np.char.strip(values["COMMUNE"].astype(str))
+                if "ACHL" in block:
+                    # Certains millésimes complètent les codes par des espaces ('C100 ')
+                    values["ACHL"] = np.char.strip(values["ACHL"].astype(str))
+                    fin = achl_fin(values["ACHL"])
+                else:
+                    fin = np.full(n, -1)
+                fin = np.where(fin < 0, None, fin).tolist()
+                yield list(zip([zone] * n, [year] * n, commune.tolist(), departement(commune).tolist(),
+                               values["REGION"].tolist(), values["CMBL"].tolist(), values["TYPL"].tolist(),
+                               values["AEMM"].tolist(), values["ACHL"].tolist(), fin,
+                               values["IPONDL"].tolist()))
+
+
+def ingest_year(conn, zone, year, data_directory="data/regions"):
+    conn.execute("DELETE FROM logements WHERE zone = ? AND year = ?", (zone, year))
+    rows = 0
+    batch = []
+    for block in year_rows(zone, year, data_directory):
+        batch.extend(block)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            conn.executemany("INSERT INTO logements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO logements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        rows += len(batch)
+    return rows
+
+
+def ingest(zones, years=None, path=DATABASE_PATH, data_directory="data/regions", force=False):
+    # Chargement en masse : une transaction par année, index créés (ou
+    # complétés) à la fin. Une année dont le zip n'a pas changé (taille et
+    # date) depuis son chargement n'est pas relue.
+    conn = connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    loaded = {}
+    for zone in zones:
+        available = available_years(zone, data_directory)
+        for year in available if years is None else [y for y in years if y in available]:
+            signature = source_signature(zip_path(zone, year, data_directory))
+            known = conn.execute("SELECT source, size, mtime_ns FROM sources WHERE zone = ? AND year = ?",
+                                 (zone, year)).fetchone()
+            if not force and known == (signature["source"], signature["size"], signature["mtime_ns"]):
+                continue
+            with conn:
+                rows = ingest_year(conn, zone, year, data_directory)
+                conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                             (zone, year, signature["source"], signature["size"], signature["mtime_ns"], rows))
+            loaded[zone, year] = rows
+            print(f"Zone {zone}, {year} : {rows} lignes chargées")
+    with conn:
+        for column in INDEXED_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS logements_{column} ON logements ({column})")
+        conn.execute("ANALYZE")
+    conn.close()
+    return loaded
+
+
+def _condition(column, value):
+    # Même convention que Cube.slice : valeur unique, liste de valeurs ou
+    # intervalle (début, fin) inclusif, None pour une borne ouverte
+    if isinstance(value, tuple):
+        start, end = value
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(end)
+        return " AND ".join(clauses) or "1", params
+    if isinstance(value, (list, set)):
+        value = list(value)
+        return f"{column} IN ({', '.join('?' * len(value))})", value
+    return f"{column} = ?", [value]
+
+
+def weighted(by=(), path=DATABASE_PATH, **filters):
+    # Logements pondérés (somme des IPONDL) et nombre de lignes, regroupés
+    # par les colonnes de by, ex. fioul dans le 77 construit avant 1971 :
+    # weighted(by=["year"], CMBL=3, DEPT="77", ACHL_FIN=(None, 1970))
+    columns = NUMERIC_COLUMNS | {"zone", "COMMUNE", "DEPT", "ACHL"}
+    unknown = [column for column in list(by) + list(filters) if column not in columns]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {unknown}")
+
+    conditions, params = [], []
+    for column, value in filters.items():
+        condition, values = _condition(column, value)
+        conditions.append(condition)
+        params.extend(values)
+    select = ", ".join(list(by) + ["SUM(IPONDL) AS logements", "COUNT(*) AS lignes"])
+    query = f"SELECT {select} FROM logements"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if by:
+        query += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+
+def parse_filter(text):
+    # COLONNE=valeur, COLONNE=a,b,c (liste) ou COLONNE=début:fin (intervalle)
+    column, value = text.split("=", 1)
+
+    def convert(item):
+        if not item:
+            return None
+        return int(item) if column in NUMERIC_COLUMNS else item
+    if ":" in value:
+        start, end = value.split(":", 1)
+        return column, (convert(start), convert(end))
+    if "," in value:
+        return column, [convert(item) for item in value.split(",")]
+    return column, convert(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Base SQLite des fichiers FD_LOGEMT et agrégats pondérés")
+    parser.add_argument("--database", default=DATABASE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="charge les zips dans la base")
+    ingest_parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    ingest_parser.add_argument("--first-year", type=int, default=None)
+    ingest_parser.add_argument("--last-year", type=int, default=None)
+    ingest_parser.add_argument("--data-directory", default="data/regions")
+    ingest_parser.add_argument("--force", action="store_true")
+
+    query_parser = subparsers.add_parser("query", help="logements pondérés, ex. --filter CMBL=3 DEPT=77 ACHL_FIN=:1970")
+    query_parser.add_argument("--filter", nargs="*", default=[])
+    query_parser.add_argument("--by", nargs="*", default=[])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "ingest":
+        years = None
+        if args.first_year is not None or args.last_year is not None:
+            years = range(args.first_year or 0, (args.last_year or 9999) + 1)
+        ingest(args.zones, years, args.database, args.data_directory, args.force)
+    else:
+        filters = dict(parse_filter(text) for text in args.filter)
+        print(weighted(args.by, args.database, **filters).to_string(index=False))
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import functools
+import glob
+import os
+import re
+
+# Dictionnaire des variables des fichiers détail (MOD_LOGEMT_{année}.txt de
+# l'Insee, latin-1, VAR_CODE;VAR_LIB;MOD_CODE;MOD_LIB) : modalités, libellés,
+# codes hors champ et type compact de chaque variable. Lu une fois par
+# millésime ; une année sans dictionnaire prend le plus proche. Sans numpy ni
+# pandas, pour rester utilisable par fioul.py.
+
+MOD_DIRECTORY = "data"
+
+WEIGHT_COLUMN = "IPONDL"
+
+# Codes hors champ : codes en lettres des variables numériques ('Z' hors
+# logement ordinaire, 'Y' hors résidence principale, 'X', ...) et codes
+# numériques des logements inoccupés (AEMM 0000, ANEM 999, ...)
+LETTER_SENTINEL_LABELS = ("Hors", "Sans objet", "Logement ordinaire")
+NUMERIC_SENTINEL_LABEL = "Logement ordinaire inoccupé"
+
+# Variables dont les codes changent de forme d'un millésime à l'autre :
+# ACHL est en chiffres (111, 211, ...) dans le dictionnaire 2015, en lettres
+# dans les suivants ; un type entier tiré du 2015 ferait de chaque valeur un
+# code hors champ. Gardées en texte (comme dans logements_db.py).
+TEXT_VARIABLES = ("ACHL",)
+
+
+class Variable:
+
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+        # {code: libellé} dans l'ordre du dictionnaire
+        self.modalities = {}
+
+    def _is_sentinel(self, code, label):
+        if code.isdigit():
+            return label.startswith(NUMERIC_SENTINEL_LABEL)
+        return label.startswith(LETTER_SENTINEL_LABELS)
+
+    @property
+    def codes(self):
+        return list(self.modalities)
+
+    @property
+    def sentinels(self):
+        return [code for code, label in self.modalities.items() if self._is_sentinel(code, label)]
+
+    @property
+    def dtype(self):
+        # 'str' pour les codes géographiques (sans modalités) et les
+        # variables en lettres (CATIRIS, ...), float32 pour le poids, sinon le
+        # plus petit entier qui contient tous les codes numériques. Les
+        # comptages (INPER, ...) n'ont que des codes hors champ : int8.
+        if self.name == WEIGHT_COLUMN:
+            return "float32"
+        if self.name in TEXT_VARIABLES:
+            return "str"
+        values = [code for code, label in self.modalities.items() if not self._is_sentinel(code, label)]
+        if not self.modalities or any(not code.isdigit() for code in values):
+            return "str"
+        largest = max((int(code) for code in self.modalities if code.isdigit()), default=0)
+        return "int8" if largest <= 127 else "int16"
+
+    def labels(self):
+        # {code entier: libellé} hors codes hors champ, ex. TYPL 1 -> 'Maison'
+        return {int(code): label for code, label in self.modalities.items()
+                if code.isdigit() and not self._is_sentinel(code, label)}
+
+
+def dictionary_years(mod_directory=MOD_DIRECTORY):
+    paths = glob.glob(f"{mod_directory}/MOD_LOGEMT_*.txt")
+    matches = (re.search(r"MOD_LOGEMT_(\d{4})\.txt$", path) for path in paths)
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def dictionary_path(year=None, mod_directory=MOD_DIRECTORY):
+    # Dictionnaire du millésime, le plus proche sinon (le plus récent si
+    # year est None)
+    years = dictionary_years(mod_directory)
+    if not years:
+        raise FileNotFoundError(f"Aucun fichier MOD_LOGEMT_*.txt dans {mod_directory}")
+    chosen = years[-1] if year is None else min(years, key=lambda y: (abs(y - year), -y))
+    return f"{mod_directory}/MOD_LOGEMT_{chosen}.txt"
+
+
+@functools.lru_cache(maxsize=None)
+def read_dictionary(path):
+    # {variable: Variable} dans l'ordre des colonnes des fichiers détail
+    variables = {}
+    with open(path, 'r', encoding='latin-1', newline='') as f:
+        rows = csv.reader(f, delimiter=';')
+        next(rows)
+        for row in rows:
+            if not row:
+                continue
+            variable = variables.setdefault(row[0], Variable(row[0], row[1]))
+            if len(row) > 2 and row[2]:
+                variable.modalities[row[2]] = row[3]
+    return variables
+
+
+def schema(year=None, mod_directory=MOD_DIRECTORY):
+    return read_dictionary(os.path.abspath(dictionary_path(year, mod_directory)))
+
+
+def labels(variable, year=None, mod_directory=MOD_DIRECTORY):
+    return schema(year, mod_directory)[variable].labels()
+
+
+def compact_dtypes(columns, year=None, mod_directory=MOD_DIRECTORY):
+    # Types compacts des colonnes numériques (les colonnes texte sont omises)
+    variables = schema(year, mod_directory)
+    return {column: variables[column].dtype for column in columns
+            if column in variables and variables[column].dtype != "str"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Variables, types et modalités des fichiers détail FD_LOGEMT")
+    parser.add_argument("variables", nargs="*")
+    parser.add_argument("--year", type=int, default=None)
+    parser.add_argument("--mod-directory", default=MOD_DIRECTORY)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    variables = schema(args.year, args.mod_directory)
+    for name in args.variables or variables:
+        variable = variables[name]
+        print(f"{name:<10} {variable.dtype:<8} {len(variable.modalities):>4} modalités, "
+              f"hors champ {variable.sentinels}  {variable.label}")
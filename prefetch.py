@@ -0,0 +1,126 @@
+import collections
+import queue
+import threading
+import zipfile
+
+from fast_reader import BLOCK_SIZE
+from fd_logemt import member_name, zip_path
+
+# Décompression en avance : un thread par année lit le membre du zip par
+# morceaux de CHUNK_SIZE octets dans une file bornée pendant que le thread
+# principal découpe et agrège l'année en cours. zlib (et le crc32 du zip)
+# relâchent le GIL : sur une machine à plusieurs coeurs, la décompression
+# des années suivantes se fait pendant l'analyse et seule l'attente sur la
+# file reste visible. Texte en attente borné à (depth + 1) x buffer_mb.
+
+CHUNK_SIZE = BLOCK_SIZE
+BUFFER_MB = 16
+
+
+class PrefetchedMember:
+    # Fichier en lecture seule (read, readline) alimenté par le thread
+
+    def __init__(self, path, member, buffer_mb=BUFFER_MB, chunk_size=CHUNK_SIZE):
+        self.chunks = queue.Queue(maxsize=max(1, int(buffer_mb * 1024 * 1024 // chunk_size)))
+        self.stopped = threading.Event()
+        self.error = None
+        self.finished = False
+        self.pending = collections.deque()
+        self.pending_size = 0
+        self.thread = threading.Thread(target=self._inflate, args=(path, member, chunk_size), daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _inflate(self, path, member, chunk_size):
+        try:
+            with zipfile.ZipFile(path, 'r') as z:
+                with z.open(member) as f:
+                    while not self.stopped.is_set():
+                        data = f.read(chunk_size)
+                        self._put(data)
+                        if not data:
+                            return
+        except Exception as error:
+            self.error = error
+            self._put(b'')
+
+    def _put(self, data):
+        # Attente par intervalles : close() peut interrompre un thread bloqué
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _fill(self):
+        data = self.chunks.get()
+        if not data:
+            self.finished = True
+            if self.error is not None:
+                raise self.error
+        self.pending.append(data)
+        self.pending_size += len(data)
+
+    def _take(self, size):
+        # size premiers octets en attente, une seule copie (aucune si un
+        # morceau suffit)
+        if len(self.pending[0]) >= size:
+            data = self.pending.popleft()
+        else:
+            data = b''.join(self.pending)
+            self.pending.clear()
+        if len(data) > size:
+            self.pending.appendleft(data[size:])
+            data = data[:size]
+        self.pending_size -= len(data)
+        return data
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or self.pending_size < size):
+            self._fill()
+        size = self.pending_size if size < 0 else min(size, self.pending_size)
+        return self._take(size) if size else b''
+
+    def readline(self, size=-1):
+        while not self.finished and not any(b'\n' in data for data in self.pending):
+            self._fill()
+        end = self.pending_size
+        offset = 0
+        for data in self.pending:
+            position = data.find(b'\n')
+            if position >= 0:
+                end = offset + position + 1
+                break
+            offset += len(data)
+        return self.read(end if size < 0 else min(end, size))
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def prefetch_years(keys, depth=2, data_directory="data/regions", buffer_mb=BUFFER_MB):
+    # (zone, année) dans l'ordre de keys avec son membre en cours de
+    # décompression ; depth années suivantes décompressées en avance
+    keys = list(keys)
+    pending = collections.deque()
+    try:
+        for index, (zone, year) in enumerate(keys):
+            while len(pending) <= depth and index + len(pending) < len(keys):
+                next_zone, next_year = keys[index + len(pending)]
+                pending.append(PrefetchedMember(zip_path(next_zone, next_year, data_directory),
+                                                member_name(next_zone, next_year), buffer_mb).start())
+            with pending.popleft() as member:
+                yield (zone, year), member
+    finally:
+        for member in pending:
+            member.close()
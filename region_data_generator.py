@@ -1,82 +1,254 @@
-import pandas as pd
-import json
+import argparse
+import hashlib
 import os
-import zipfile
-
-FIRST_YEAR = 2010
-LAST_YEAR = 2022
-
-zone = "E"
-data_directory = f"data/regions/{zone}"
-
-COMBUSTIBLES = {
-    1: "Chauffage urbain",
-    2: "Gaz de ville/réseau",
-    3: "Fioul (mazout)",
-    4: "Électricité",
-    5: "Gaz bouteille/citerne",
-    6: "Autre"
-}
-
-TYPES_LOGEMENTS = {
-    1: "Maison individuelle",
-    2: "Appartement",
-    3: "Autre"
-}
-
-fioul_par_annee_emmenagement = {}
-fioul_par_type_logement = {}
-fioul_par_annee_et_type = {}
-
-for year in range(FIRST_YEAR, LAST_YEAR + 1):
-    zip_path = f"{data_directory}/{year}.zip"
-    
-    if year < 2016:
-        file_name = f"FD_LOGEMTZ{zone}_{year}.txt"
-    else:
-        file_name = f"FD_LOGEMTZ{zone}_{year}.csv"
-        
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        with z.open(file_name) as f:
-            df = pd.read_csv(f, sep=';', usecols=["CMBL", "IPONDL", "AEMM", "TYPL"])
-
-    df["CMBL"] = pd.to_numeric(df["CMBL"], errors="coerce")
-    
-    if pd.api.types.is_string_dtype(df["IPONDL"]):
-        df["IPONDL"] = df["IPONDL"].str.replace(",", ".")
-    df["IPONDL"] = pd.to_numeric(df["IPONDL"], errors="coerce")
-    df["AEMM"] = pd.to_numeric(df["AEMM"], errors="coerce")
-    df["TYPL"] = pd.to_numeric(df["TYPL"], errors="coerce")
-
-    df_fioul = df[df["CMBL"] == 3].copy()
-
-    fioul_par_annee_emmenagement[year] = {}
-    for annee_emm in df_fioul["AEMM"].unique():
-        if not pd.isna(annee_emm):
-            count = df_fioul.loc[df_fioul["AEMM"] == annee_emm, "IPONDL"].sum()
-            fioul_par_annee_emmenagement[year][int(annee_emm)] = count
-
-    fioul_par_type_logement[year] = {}
-    for type_log in df_fioul["TYPL"].unique():
-        if not pd.isna(type_log):
-            count = df_fioul.loc[df_fioul["TYPL"] == type_log, "IPONDL"].sum()
-            fioul_par_type_logement[year][int(type_log)] = count
-
-    fioul_par_annee_et_type[year] = {}
-    for annee_emm in df_fioul["AEMM"].unique():
-        if not pd.isna(annee_emm):
-            fioul_par_annee_et_type[year][int(annee_emm)] = {}
-            for type_log in df_fioul["TYPL"].unique():
-                if not pd.isna(type_log):
-                    mask = (df_fioul["AEMM"] == annee_emm) & (df_fioul["TYPL"] == type_log)
-                    count = df_fioul.loc[mask, "IPONDL"].sum()
-                    fioul_par_annee_et_type[year][int(annee_emm)][int(type_log)] = count
-
-results_dir = f'results/{zone}'
-os.makedirs(results_dir, exist_ok=True)
-
-with open(f'{results_dir}/fioul_par_annee_emmenagement.json', 'w', encoding='utf-8') as f:
-    json.dump(fioul_par_annee_emmenagement, f, indent=2, ensure_ascii=False)
-
-with open(f'{results_dir}/fioul_par_type_logement.json', 'w', encoding='utf-8') as f:
-    json.dump(fioul_par_type_logement, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aggregation import FioulAggregate, aggregate_fioul
+from block_archive import BLOCKS_DIRECTORY, iter_block_chunks, load_index, split_blocks
+from columnar_cache import CACHE_DIRECTORY, load_year
+from cube import Cube, add_chunk
+from fd_logemt import (ZONES, available_years, block_size_for_budget, iter_member_chunks, iter_year_chunks,
+                       memory_budget, memory_footprint, read_year, zip_path)
+import run_report
+from prefetch import prefetch_years
+from results_store import (RESULTS_DIRECTORY, ZoneResults, available_zones, load_manifest, partial_paths,
+                           save_manifest)
+
+DATA_DIRECTORY = "data/regions"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def aggregate_partials(year, chunks):
+    # Une passe sur les blocs : agrégat fioul (AEMM x TYPL) et cube partiel
+    # de l'année (CMBL x TYPL x AEMM x REGION, poids et nombres de lignes)
+    fioul, cube = FioulAggregate(), Cube.empty([year])
+    for chunk in chunks:
+        aggregate_fioul(chunk, fioul)
+        add_chunk(cube, year, chunk)
+    return fioul, cube
+
+
+def process_year(zone, year, streaming=False, memory_budget_mb=256, data_directory=DATA_DIRECTORY,
+                 cache_directory=CACHE_DIRECTORY, compact=False):
+    # Lecture du zip par blocs si streaming : la mémoire de travail reste
+    # sous memory_budget_mb quelle que soit la taille de l'année. Sinon
+    # l'année est lue depuis le cache colonnes (cache_directory=None pour
+    # relire le zip sans cache) et son empreinte mémoire est relevée.
+    if streaming:
+        chunks = iter_year_chunks(zone, year, block_size_for_budget(memory_budget_mb), data_directory)
+        return (zone, year, *aggregate_partials(year, chunks), {})
+    with run_report.stage("lecture") as entry:
+        if cache_directory is not None:
+            df = load_year(zone, year, data_directory, cache_directory, compact)
+        else:
+            df = read_year(zone, year, data_directory, compact=compact)
+        entry["rows"] += len(df)
+    footprint = {"rows": len(df), "memory_bytes": memory_footprint(df), "compact": compact}
+    return (zone, year, *aggregate_partials(year, [df]), footprint)
+
+
+def process_prefetched(zone, year, member, memory_budget_mb=256):
+    # Année décompressée en avance par un thread (prefetch.py), découpée en
+    # blocs comme en streaming : l'étape decompression ne mesure plus que
+    # l'attente du thread principal
+    chunks = iter_member_chunks(member, block_size_for_budget(memory_budget_mb))
+    return (zone, year, *aggregate_partials(year, chunks), {})
+
+
+def process_blocks(zone, year, blocks, index, blocks_directory=BLOCKS_DIRECTORY):
+    # Partie d'une année reconditionnée (block_archive.py) : blocs lus
+    # directement à leur position, agrégats partiels fusionnés ensuite
+    return (zone, year, *aggregate_partials(year, iter_block_chunks(zone, year, blocks, index, blocks_directory)), {})
+
+
+def write_results(zone, aggregates, results_directory=RESULTS_DIRECTORY, json_export=False):
+    # Store binaire (results/{zone}/store/*.npy) ; les fichiers JSON
+    # historiques ne sont réécrits que sur demande
+    results = ZoneResults.from_aggregates(aggregates)
+    os.makedirs(f'{results_directory}/{zone}', exist_ok=True)
+    results.save(zone, results_directory)
+    if json_export:
+        results.export_json(zone, results_directory)
+
+
+def archive_signature(path):
+    with run_report.stage("hash") as entry:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        entry["bytes"] += os.path.getsize(path)
+    return {"sha256": digest.hexdigest(), "size": os.path.getsize(path)}
+
+
+def build_zones(zones, years=None, workers=None, streaming=False, memory_budget_mb=256,
+                data_directory=DATA_DIRECTORY, results_directory=RESULTS_DIRECTORY,
+                cache_directory=CACHE_DIRECTORY, force=False, compact=False, json_export=False,
+                trace_memory=False, profile=False, prefetch=0, blocks_directory=None):
+    # Reconstruction incrémentale : le manifeste de chaque zone garde le hash
+    # et la taille de chaque zip avec l'agrégat partiel de l'année
+    # (results/{zone}/partials/{année}.npz) et son cube partiel
+    # ({année}_cube.npz, pour rollup.py). Seules les années nouvelles ou
+    # modifiées sont relues, par un processus du pool par couple (zone, année),
+    # puis fusionnées avec les années déjà présentes. Le rapport d'exécution
+    # de chaque zone (results/{zone}/run_report_generator.json) cumule les
+    # étapes de ses processus. Avec prefetch > 0, les années à relire sont
+    # lues dans ce processus, prefetch années décompressées en avance par des
+    # threads (zips lus sans cache colonnes, comme en streaming). Avec
+    # blocks_directory, une année reconditionnée en blocs (block_archive.py)
+    # est répartie entre les processus du pool par groupes de blocs.
+    # Zone sans aucun zip (répertoire absent ou vide) : sautée, ses résultats
+    # ne sont pas remplacés par un store de zéro année
+    skipped = [zone for zone in zones if not available_years(zone, data_directory)]
+    if len(skipped) == len(zones):
+        raise FileNotFoundError(f"Aucun zip pour les zones {skipped} dans {data_directory}")
+    for zone in skipped:
+        print(f"Zone {zone} : aucun zip dans {data_directory}/{zone}, résultats inchangés")
+    zones = [zone for zone in zones if zone not in skipped]
+    reports = {zone: run_report.RunReport(trace_memory, profile) for zone in zones}
+    options = dict(trace_memory=trace_memory, profile=profile)
+    manifests = {zone: load_manifest(zone, results_directory) for zone in zones}
+    # Premier passage sur une zone aux résultats déjà là (fichiers JSON ou
+    # store converti, sans manifeste) : les agrégats partiels des autres
+    # années manquent, un store de quelques années masquerait l'historique
+    partial = [zone for zone in zones if years is not None and not manifests[zone]
+               and zone in available_zones(results_directory)
+               and not set(available_years(zone, data_directory)) <= set(years)]
+    if partial:
+        raise ValueError(f"Zones {partial} sans manifeste dans {results_directory} : "
+                         f"le premier passage lit toutes les années, sans --first-year/--last-year")
+    sources = {}
+    for zone in zones:
+        available = available_years(zone, data_directory)
+        for year in available if years is None else [y for y in years if y in available]:
+            sources[zone, year] = zip_path(zone, year, data_directory)
+        # Les années dont le zip a disparu sont retirées des résultats
+        for year in [y for y in manifests[zone] if y not in available]:
+            entry = manifests[zone].pop(year)
+            for partial in (entry["partial"], entry.get("cube")):
+                if partial and os.path.exists(f'{results_directory}/{zone}/{partial}'):
+                    os.remove(f'{results_directory}/{zone}/{partial}')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        signatures = {}
+        hashing = {key: pool.submit(run_report.collect, archive_signature, path, **options)
+                   for key, path in sources.items()}
+        for (zone, year), future in hashing.items():
+            signatures[zone, year], report = future.result()
+            reports[zone].merge(report)
+        # Les années sans cube partiel (manifestes plus anciens) sont relues
+        stale = [(zone, year) for (zone, year), signature in signatures.items()
+                 if force or {k: manifests[zone].get(year, {}).get(k) for k in signature} != signature
+                 or "cube" not in manifests[zone].get(year, {})]
+
+        tasks = {key: 1 for key in stale}
+        if prefetch:
+            done = (run_report.collect(process_prefetched, zone, year, member, memory_budget_mb, **options)
+                    for (zone, year), member in prefetch_years(stale, prefetch, data_directory))
+        else:
+            futures = []
+            for zone, year in stale:
+                index = None if blocks_directory is None else load_index(zone, year, data_directory,
+                                                                         blocks_directory)
+                if index is None:
+                    futures.append(pool.submit(run_report.collect, process_year, zone, year, streaming,
+                                               memory_budget_mb, data_directory, cache_directory, compact,
+                                               **options))
+                    continue
+                groups = split_blocks(index, workers or os.cpu_count())
+                tasks[zone, year] = len(groups)
+                futures += [pool.submit(run_report.collect, process_blocks, zone, year, blocks, index,
+                                        blocks_directory, **options) for blocks in groups]
+            done = (future.result() for future in as_completed(futures))
+        parts = {}
+        for (zone, year, fioul, cube, footprint), report in done:
+            reports[zone].merge(report)
+            if tasks[zone, year] > 1:
+                # Année répartie entre plusieurs processus : écrite une fois
+                # toutes ses parties reçues
+                parts.setdefault((zone, year), []).append((fioul, cube))
+                if len(parts[zone, year]) < tasks[zone, year]:
+                    continue
+                received = parts.pop((zone, year))
+                fioul = FioulAggregate()
+                for part, _ in received:
+                    fioul.merge(part)
+                cube = Cube.merged(part for _, part in received)
+            partial, cube_partial = partial_paths(year)
+            with run_report.active(reports[zone]), run_report.stage("ecriture"):
+                os.makedirs(f'{results_directory}/{zone}/partials', exist_ok=True)
+                fioul.save(f'{results_directory}/{zone}/{partial}')
+                cube.save(f'{results_directory}/{zone}/{cube_partial}', compressed=True)
+            manifests[zone][year] = dict(signatures[zone, year], partial=partial, cube=cube_partial, **footprint)
+            if footprint:
+                print(f"Zone {zone}, {year} : {footprint['rows']} lignes, "
+                      f"{footprint['memory_bytes'] / 1e6:.1f} Mo en mémoire")
+
+    aggregates = {}
+    for zone in zones:
+        with run_report.active(reports[zone]), run_report.stage("ecriture"):
+            aggregates[zone] = {year: FioulAggregate.load(f'{results_directory}/{zone}/{entry["partial"]}')
+                                for year, entry in manifests[zone].items()}
+            write_results(zone, aggregates[zone], results_directory, json_export)
+            save_manifest(zone, manifests[zone], results_directory)
+        profile_path = reports[zone].dump_hottest_profile(
+            f'{results_directory}/{zone}/profile_generator_{{stage}}.prof') if profile else None
+        reports[zone].save(f'{results_directory}/{zone}/run_report_generator.json',
+                           pipeline="region_data_generator", zone=zone, workers=workers,
+                           years=sorted(manifests[zone]),
+                           processed=sorted(year for z, year in stale if z == zone),
+                           profile=profile_path)
+    return aggregates
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agrégats fioul par zone à partir des fichiers FD_LOGEMT")
+    parser.add_argument("--zones", nargs="+", default=list(ZONES), choices=list(ZONES))
+    parser.add_argument("--first-year", type=int, default=None,
+                        help="par défaut : toutes les années présentes dans --data-directory")
+    parser.add_argument("--last-year", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="nombre de processus (par défaut : nombre de coeurs)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="lecture des zips par blocs, mémoire bornée par --memory-budget-mb")
+    parser.add_argument("--memory-budget-mb", type=memory_budget, default=256)
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="années décompressées en avance par des threads pendant l'analyse de l'année "
+                             "en cours (dans le processus principal, sans cache colonnes)")
+    parser.add_argument("--blocks", action="store_true",
+                        help="années reconditionnées par block_archive.py réparties entre les processus")
+    parser.add_argument("--blocks-directory", default=BLOCKS_DIRECTORY)
+    parser.add_argument("--data-directory", default=DATA_DIRECTORY)
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    parser.add_argument("--cache-directory", default=CACHE_DIRECTORY)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="relire les zips sans passer par le cache colonnes")
+    parser.add_argument("--compact", action="store_true",
+                        help="codes en petits entiers et poids en float32 (mémoire divisée par ~4)")
+    parser.add_argument("--force", action="store_true",
+                        help="recalculer toutes les années, même inchangées")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="pic mémoire tracemalloc de chaque étape dans le rapport d'exécution (plus lent)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profil cProfile de l'étape la plus longue (results/{zone}/profile_generator_*.prof)")
+    parser.add_argument("--json", action="store_true",
+                        help="écrire aussi fioul_par_annee_emmenagement.json et fioul_par_type_logement.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    years = None
+    if args.first_year is not None or args.last_year is not None:
+        years = range(args.first_year or 0, (args.last_year or 9999) + 1)
+    try:
+        build_zones(args.zones, years, workers=args.workers,
+                    streaming=args.streaming, memory_budget_mb=args.memory_budget_mb,
+                    data_directory=args.data_directory, results_directory=args.results_directory,
+                    cache_directory=None if args.no_cache else args.cache_directory,
+                    force=args.force, compact=args.compact, json_export=args.json,
+                    trace_memory=args.trace_memory, profile=args.profile, prefetch=args.prefetch,
+                    blocks_directory=args.blocks_directory if args.blocks else None)
+    except ValueError as error:
+        raise SystemExit(f"region_data_generator.py : {error}")
@@ -1,85 +1,75 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import argparse
+import hashlib
+import inspect
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-plt.style.use('seaborn-v0_8')
-
-zone = "A"
-results_dir = f'results/{zone}'
-
-os.makedirs(results_dir, exist_ok=True)
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 
-FIRST_YEAR = 2010
-LAST_YEAR = 2022
+import fioul
+import mod_logemt
+import run_report
+from results_store import RESULTS_DIRECTORY, available_zones, decennies, load_results
 
-COMBUSTIBLES = {
-    1: "Chauffage urbain",
-    2: "Gaz de ville/réseau",
-    3: "Fioul (mazout)",
-    4: "Électricité",
-    5: "Gaz bouteille/citerne",
-    6: "Autre"
-}
+plt.style.use('seaborn-v0_8')
 
-TYPES_LOGEMENTS = {
-    1: "Maison individuelle",
-    2: "Appartement",
-    3: "Autre"
-}
+DPI = 300
 
-fioul_par_annee_emmenagement = {}
-fioul_par_type_logement = {}
+def survey_years(results):
+    return int(results.years[0]), int(results.years[-1])
 
-with open(f'{results_dir}/fioul_par_annee_emmenagement.json', 'r', encoding='utf-8') as f:
-    data_raw = json.load(f)
-    fioul_par_annee_emmenagement = {
-        int(k): {int(ki): vi for ki, vi in v.items()} for k, v in data_raw.items()}
 
-with open(f'{results_dir}/fioul_par_type_logement.json', 'r', encoding='utf-8') as f:
-    data_raw_type = json.load(f)
-    fioul_par_type_logement = {
-        int(k): {int(ki): vi for ki, vi in v.items()} for k, v in data_raw_type.items()}
+def par_annee_enquete(weights, results):
+    # Une ligne par année d'enquête de first_year à last_year, 0 pour une
+    # année absente des résultats
+    first_year, last_year = survey_years(results)
+    matrix = np.zeros((last_year - first_year + 1, weights.shape[1]))
+    matrix[results.years - first_year] = weights
+    return matrix
 
-print("=" * 60)
-print("LOGEMENTS AU FIOUL PAR ANNÉE D'EMMÉNAGEMENT")
-print("=" * 60)
 
-all_annees_emm = set()
-for year_data in fioul_par_annee_emmenagement.values():
-    all_annees_emm.update(year_data.keys())
-all_annees_emm = sorted([a for a in all_annees_emm if a >= 1950])
+# graph 1: heatmap
+def plot_heatmap(zone, results):
+    first_year, last_year = survey_years(results)
+
+    columns = results.present_aemm.any(axis=0) & (results.aemm >= 1950)
+    all_annees_emm = results.aemm[columns]
+    df_fioul_emm_cumul = par_annee_enquete(results.par_annee_emmenagement, results)[:, columns]
+
+    fig = plt.figure(figsize=(16, 10))
+    if len(all_annees_emm):
+        plt.imshow(df_fioul_emm_cumul, cmap='YlOrRd', aspect='auto',
+                   extent=[min(all_annees_emm), max(all_annees_emm), last_year, first_year])
+        plt.colorbar(label='Nombre de logements au fioul (pondéré)')
+    else:
+        # Aucun emménagement depuis 1950 (petite commune exportée par
+        # commune_aggregates.py) : heatmap vide
+        plt.text(0.5, 0.5, 'Aucun logement au fioul emménagé depuis 1950', ha='center', va='center',
+                 transform=plt.gca().transAxes)
+        plt.ylim(first_year - 0.5, last_year + 0.5)
+    plt.xlabel('Année d\'emménagement')
+    plt.ylabel('Année de l\'enquête')
+    plt.title(f'Logements au fioul par année d\'emménagement\n(Zone {zone}, {first_year}-{last_year})', fontsize=14)
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    return fig, "heatmap_annee_emmenagement.png"
 
-df_fioul_emm_cumul = pd.DataFrame(index=all_annees_emm)
 
-for year in range(FIRST_YEAR, LAST_YEAR + 1):
-    year_data = fioul_par_annee_emmenagement.get(year, {})
-    counts = [year_data.get(annee, 0) for annee in all_annees_emm]
-    df_fioul_emm_cumul[year] = counts
+# graph 2 : bar chart derniere annee
+def plot_bar_distribution(zone, results):
+    _, current_analysis_year = survey_years(results)
 
-# graph 1: heatmap
-plt.figure(figsize=(16, 10))
-plt.imshow(df_fioul_emm_cumul.T, cmap='YlOrRd', aspect='auto',
-           extent=[min(all_annees_emm), max(all_annees_emm), LAST_YEAR, FIRST_YEAR])
-plt.colorbar(label='Nombre de logements au fioul (pondéré)')
-plt.xlabel('Année d\'emménagement')
-plt.ylabel('Année de l\'enquête')
-plt.title(f'Logements au fioul par année d\'emménagement\n(Zone {zone}, {FIRST_YEAR}-{LAST_YEAR})', fontsize=14)
-plt.gca().invert_yaxis()
-plt.tight_layout()
-plt.savefig(f"{results_dir}/heatmap_annee_emmenagement.png", bbox_inches='tight', dpi=300)
-plt.show()
+    row = results.row(current_analysis_year)
+    data_last_year = results.par_annee_emmenagement[row]
+    mask = results.present_aemm[row] & (results.aemm >= 1950) & (data_last_year > 0)
+    annees_emm_last = results.aemm[mask]
+    counts_last = data_last_year[mask]
 
-# graph 2 : bar chart derniere annee
-current_analysis_year = LAST_YEAR
-if current_analysis_year in fioul_par_annee_emmenagement:
-    data_last_year = fioul_par_annee_emmenagement[current_analysis_year]
-    annees_emm_last = sorted(
-        [k for k in data_last_year.keys() if k >= 1950 and data_last_year[k] > 0])
-    counts_last = [data_last_year[k] for k in annees_emm_last]
-
-    plt.figure(figsize=(14, 8))
+    fig = plt.figure(figsize=(14, 8))
     plt.bar(annees_emm_last, counts_last, alpha=0.7,
             color='red', edgecolor='darkred')
     plt.title(f'Logements au fioul par année d\'emménagement\n(Enquête {current_analysis_year} - Zone {zone})', fontsize=14)
@@ -88,79 +78,86 @@ if current_analysis_year in fioul_par_annee_emmenagement:
     plt.grid(True, alpha=0.3, axis='y')
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(f"{results_dir}/bar_distribution_{current_analysis_year}.png", bbox_inches='tight', dpi=300)
-    plt.show()
+    return fig, f"bar_distribution_{current_analysis_year}.png"
+
 
 # graph 3 : evolution par decennie
-decennies = ['1950-1959', '1960-1969', '1970-1979', '1980-1989',
-             '1990-1999', '2000-2009', '2010-2019', '2020-2022']
-
-fioul_par_decennie = {dec: [] for dec in decennies}
-years_survey = list(range(FIRST_YEAR, LAST_YEAR + 1))
-
-for year in years_survey:
-    data = fioul_par_annee_emmenagement.get(year, {})
-    for decennie in decennies:
-        start, end = map(int, decennie.split('-'))
-        total_decennie = sum(data.get(annee, 0) for annee in data.keys()
-                             if start <= annee <= end)
-        fioul_par_decennie[decennie].append(total_decennie)
-
-plt.figure(figsize=(14, 8))
-for decennie in decennies:
-    plt.plot(years_survey, fioul_par_decennie[decennie],
-             marker='o', linewidth=2, label=decennie)
-
-plt.title(f'Évolution des logements au fioul par décennie d\'emménagement\n(Zone {zone}, {FIRST_YEAR}-{LAST_YEAR})', fontsize=14)
-plt.xlabel('Année de l\'enquête')
-plt.ylabel('Nombre de logements au fioul (pondéré)')
-plt.grid(True, alpha=0.3)
-plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left',
-           title='Décennie d\'emménagement')
-plt.xticks(years_survey)
-plt.tight_layout()
-plt.savefig(f"{results_dir}/evolution_par_decennie.png", bbox_inches='tight', dpi=300)
-plt.show()
-
-print("\n" + "=" * 60)
-print("LOGEMENTS AU FIOUL PAR TYPE DE LOGEMENT")
-print("=" * 60)
-
-fioul_par_type_combined = {}
-for type_log in TYPES_LOGEMENTS.keys():
-    fioul_par_type_combined[type_log] = []
-    
-    for year in range(FIRST_YEAR, LAST_YEAR + 1):
-        data = fioul_par_type_logement.get(year, {})
-        fioul_par_type_combined[type_log].append(data.get(type_log, 0))
+def plot_evolution_par_decennie(zone, results):
+    first_year, last_year = survey_years(results)
+
+    # Tranches d'AEMM lues dans les sommes cumulées, une colonne par décennie
+    starts, ends = decennies(results)
+    years_survey = list(range(first_year, last_year + 1))
+    data = par_annee_enquete(results.aemm_ranges(starts, ends), results)
+
+    fig = plt.figure(figsize=(14, 8))
+    for column, (start, end) in enumerate(zip(starts, ends)):
+        plt.plot(years_survey, data[:, column],
+                 marker='o', linewidth=2, label=f'{start}-{end}')
+
+    plt.title(f'Évolution des logements au fioul par décennie d\'emménagement\n(Zone {zone}, {first_year}-{last_year})', fontsize=14)
+    plt.xlabel('Année de l\'enquête')
+    plt.ylabel('Nombre de logements au fioul (pondéré)')
+    plt.grid(True, alpha=0.3)
+    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left',
+               title='Décennie d\'emménagement')
+    plt.xticks(years_survey)
+    plt.tight_layout()
+    return fig, "evolution_par_decennie.png"
+
+
+def fioul_par_type_combined(results):
+    data = par_annee_enquete(results.par_type_logement, results)
+
+    # Types présents dans au moins une enquête, dans l'ordre des codes
+    return {int(type_log): data[:, column] for column, type_log in enumerate(results.typl)}
+
+
+def types_logements(results):
+    # Libellés TYPL du dictionnaire de la dernière enquête
+    return mod_logemt.labels("TYPL", survey_years(results)[1])
+
 
 # graph 4 : evolution par type
-plt.figure(figsize=(12, 8))
-for type_log, counts in fioul_par_type_combined.items():
-    type_name = TYPES_LOGEMENTS[type_log]
-
-    plt.plot(range(FIRST_YEAR, LAST_YEAR + 1), counts, marker='o', linewidth=2,
-             label=type_name, markersize=6)
-
-plt.title(f'Évolution des logements au fioul par type de logement\n(Zone {zone}, {FIRST_YEAR}-{LAST_YEAR})', fontsize=14)
-plt.xlabel('Année')
-plt.ylabel('Nombre de logements au fioul (pondéré)')
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.xticks(range(FIRST_YEAR, LAST_YEAR + 1))
-plt.tight_layout()
-plt.savefig(f"{results_dir}/evolution_par_type_logement.png", bbox_inches='tight', dpi=300)
-plt.show()
+def plot_evolution_par_type_logement(zone, results):
+    first_year, last_year = survey_years(results)
+
+    type_names = types_logements(results)
+
+    fig = plt.figure(figsize=(12, 8))
+    for type_log, counts in fioul_par_type_combined(results).items():
+        type_name = type_names.get(type_log, f"Type {type_log}")
+
+        plt.plot(range(first_year, last_year + 1), counts, marker='o', linewidth=2,
+                 label=type_name, markersize=6)
+
+    plt.title(f'Évolution des logements au fioul par type de logement\n(Zone {zone}, {first_year}-{last_year})', fontsize=14)
+    plt.xlabel('Année')
+    plt.ylabel('Nombre de logements au fioul (pondéré)')
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.xticks(range(first_year, last_year + 1))
+    plt.tight_layout()
+    return fig, "evolution_par_type_logement.png"
+
+
+def types_derniere_annee(results):
+    # (codes TYPL, poids) présents dans l'enquête la plus récente
+    row = results.row(survey_years(results)[1])
+    present = results.present_typl[row]
+    return results.typl[present], results.par_type_logement[row][present]
+
 
 # graph 5 : pie chart derniere anee
-if current_analysis_year in fioul_par_type_logement:
-    data_last_types = fioul_par_type_logement[current_analysis_year]
-    labels = [TYPES_LOGEMENTS.get(k, f"Type {k}")
-              for k in data_last_types.keys()]
-    sizes = [data_last_types[k] for k in data_last_types.keys()]
-    total_last = sum(sizes)
-
-    plt.figure(figsize=(10, 8))
+def plot_repartition_type(zone, results):
+    _, current_analysis_year = survey_years(results)
+
+    codes, sizes = types_derniere_annee(results)
+    type_names = types_logements(results)
+    labels = [type_names.get(int(k), f"Type {k}") for k in codes]
+    total_last = sizes.sum()
+
+    fig = plt.figure(figsize=(10, 8))
     colors = ['#ff9999', '#66b3ff', '#99ff99']
     wedges, texts, autotexts = plt.pie(sizes, labels=labels, autopct='%1.1f%%',
                                        colors=colors, startangle=90)
@@ -173,41 +170,228 @@ if current_analysis_year in fioul_par_type_logement:
               fontsize=14)
     plt.axis('equal')
     plt.tight_layout()
-    plt.savefig(f"{results_dir}/repartition_type_{current_analysis_year}.png", bbox_inches='tight', dpi=300)
-    plt.show()
+    return fig, f"repartition_type_{current_analysis_year}.png"
+
 
 # graph 6 : stackplot
-df_fioul_types = pd.DataFrame(fioul_par_type_combined)
-
-df_fioul_types.index = range(FIRST_YEAR, LAST_YEAR + 1)
-df_fioul_types.columns = [TYPES_LOGEMENTS[col]
-                          for col in df_fioul_types.columns]
-
-plt.figure(figsize=(14, 8))
-plt.stackplot(df_fioul_types.index, df_fioul_types.T,
-              labels=df_fioul_types.columns, alpha=0.8)
-plt.title(f'Évolution cumulée des logements au fioul par type de logement\n(Zone {zone}, {FIRST_YEAR}-{LAST_YEAR})', fontsize=14)
-plt.xlabel('Année')
-plt.ylabel('Nombre de logements au fioul (pondéré)')
-plt.grid(True, alpha=0.3)
-plt.legend(title='Type de logement')
-plt.xticks(range(FIRST_YEAR, LAST_YEAR + 1))
-plt.tight_layout()
-plt.savefig(f"{results_dir}/evolution_cumulee_type.png", bbox_inches='tight', dpi=300)
-plt.show()
-
-print("\n" + "=" * 60)
-print("RÉSUMÉ DES ANALYSES")
-print("=" * 60)
-
-total_fioul_last = sum(fioul_par_type_logement[current_analysis_year].values(
-)) if current_analysis_year in fioul_par_type_logement else 0
-print(f"Nombre total de logements au fioul en {current_analysis_year} : {total_fioul_last:.0f}")
-
-if current_analysis_year in fioul_par_type_logement:
-    print(f"\nRépartition par type de logement en {current_analysis_year} :")
-    for type_log, count in fioul_par_type_logement[current_analysis_year].items():
-        type_name = TYPES_LOGEMENTS.get(type_log, f"Type {type_log}")
-        pourcentage = (count / total_fioul_last *
-                       100) if total_fioul_last > 0 else 0
-        print(f"  {type_name}: {count:.0f} logements ({pourcentage:.1f}%)")
\ No newline at end of file
+def plot_evolution_cumulee_type(zone, results):
+    first_year, last_year = survey_years(results)
+
+    df_fioul_types = pd.DataFrame(fioul_par_type_combined(results))
+
+    df_fioul_types.index = range(first_year, last_year + 1)
+    type_names = types_logements(results)
+    df_fioul_types.columns = [type_names.get(col, f"Type {col}")
+                              for col in df_fioul_types.columns]
+
+    fig = plt.figure(figsize=(14, 8))
+    plt.stackplot(df_fioul_types.index, df_fioul_types.T,
+                  labels=df_fioul_types.columns, alpha=0.8)
+    plt.title(f'Évolution cumulée des logements au fioul par type de logement\n(Zone {zone}, {first_year}-{last_year})', fontsize=14)
+    plt.xlabel('Année')
+    plt.ylabel('Nombre de logements au fioul (pondéré)')
+    plt.grid(True, alpha=0.3)
+    plt.legend(title='Type de logement')
+    plt.xticks(range(first_year, last_year + 1))
+    plt.tight_layout()
+    return fig, "evolution_cumulee_type.png"
+
+
+FIGURES = {
+    "heatmap": plot_heatmap,
+    "bar_distribution": plot_bar_distribution,
+    "evolution_par_decennie": plot_evolution_par_decennie,
+    "evolution_par_type_logement": plot_evolution_par_type_logement,
+    "repartition_type": plot_repartition_type,
+    "evolution_cumulee_type": plot_evolution_cumulee_type,
+}
+
+
+# Partie des résultats dont dépend chaque figure : seul un changement de
+# cette partie (ou du code de la figure, ou des paramètres) la fait redessiner
+def _par_annee(results):
+    return (results.years, results.aemm, results.par_annee_emmenagement, results.present_aemm)
+
+
+def _cumul_aemm(results):
+    return (results.years, results.aemm, results.cumul_aemm[:, :, 0])
+
+
+def _par_type(results):
+    return (results.years, results.typl, results.par_type_logement, results.present_typl)
+
+
+def _derniere_annee(arrays):
+    def select(results):
+        row = results.row(survey_years(results)[1])
+        _, labels, weights, present = arrays(results)
+        return (labels, weights[row], present[row])
+    return select
+
+
+FIGURE_DATA = {
+    "heatmap": _par_annee,
+    "bar_distribution": _derniere_annee(_par_annee),
+    "evolution_par_decennie": _cumul_aemm,
+    "evolution_par_type_logement": _par_type,
+    "repartition_type": _derniere_annee(_par_type),
+    "evolution_cumulee_type": _par_type,
+}
+
+
+def figure_key(zone, name, results, dpi):
+    arrays = [np.ascontiguousarray(array) for array in FIGURE_DATA[name](results)]
+    content = {
+        "zone": zone,
+        "figure": name,
+        "dpi": dpi,
+        "years": survey_years(results),
+        "types": types_logements(results),
+        "code": inspect.getsource(FIGURES[name]),
+        "arrays": [(str(array.dtype), array.shape) for array in arrays],
+    }
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode())
+    for array in arrays:
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def figures_manifest_path(zone, results_directory=RESULTS_DIRECTORY):
+    return f'{results_directory}/{zone}/figures.json'
+
+
+def load_figures_manifest(zone, results_directory=RESULTS_DIRECTORY):
+    try:
+        with open(figures_manifest_path(zone, results_directory), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_figures_manifest(zone, manifest, results_directory=RESULTS_DIRECTORY):
+    path = figures_manifest_path(zone, results_directory)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def render_figure(zone, name, dpi=DPI, show=False, results_directory=RESULTS_DIRECTORY):
+    with run_report.stage("chargement"):
+        results = load_results(zone, results_directory)
+    with run_report.stage("figure") as entry:
+        fig, file_name = FIGURES[name](zone, results)
+        entry["rows"] += 1
+    path = f"{results_directory}/{zone}/{file_name}"
+    with run_report.stage("png") as entry:
+        fig.savefig(path, bbox_inches='tight', dpi=dpi)
+        entry["rows"] += 1
+        entry["bytes"] += os.path.getsize(path)
+    if show:
+        plt.show()
+    # Fermeture explicite : en mode batch aucune figure ne reste en mémoire
+    plt.close(fig)
+    return path
+
+
+def print_summary(zone, results_directory=RESULTS_DIRECTORY):
+    # Lecture sans numpy, partagée avec le point d'entrée léger fioul.py
+    fioul.print_summary(zone, results_directory)
+
+
+def _use_headless_backend():
+    matplotlib.use("Agg")
+
+
+def render_all(zones, figures=tuple(FIGURES), dpi=DPI, workers=None,
+               results_directory=RESULTS_DIRECTORY, force=False, trace_memory=False, profile=False):
+    # Mode batch : backend Agg, pas de plt.show(), une tâche par couple
+    # (zone, figure) sur le pool de processus. Le manifeste figures.json de
+    # chaque zone garde la clé et le fichier de chaque figure : une figure
+    # dont la clé n'a pas changé et dont l'image existe n'est pas redessinée.
+    # Rapport d'exécution par zone dans results/{zone}/run_report_reader.json
+    _use_headless_backend()
+    reports = {zone: run_report.RunReport(trace_memory, profile) for zone in zones}
+    manifests = {zone: load_figures_manifest(zone, results_directory) for zone in zones}
+    keys = {}
+    for zone in zones:
+        with run_report.active(reports[zone]), run_report.stage("cles") as entry:
+            results = load_results(zone, results_directory)
+            for name in figures:
+                keys[zone, name] = figure_key(zone, name, results, dpi)
+            entry["rows"] += len(figures)
+
+    stale = [(zone, name) for zone, name in keys
+             if force or manifests[zone].get(name, {}).get("key") != keys[zone, name]
+             or not os.path.exists(f"{results_directory}/{zone}/{manifests[zone][name]['file']}")]
+
+    # Une figure en erreur n'arrête pas les autres : les figures dessinées
+    # restent dans le manifeste de leur zone
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_use_headless_backend) as pool:
+        futures = {task: pool.submit(run_report.collect, render_figure, *task, dpi, False, results_directory,
+                                     trace_memory=trace_memory, profile=profile)
+                   for task in stale}
+        for (zone, name), future in futures.items():
+            try:
+                path, report = future.result()
+            except Exception as error:
+                failed[zone, name] = f"{type(error).__name__}: {error}"
+                continue
+            reports[zone].merge(report)
+            file_name = os.path.basename(path)
+            # L'ancienne image de la figure est supprimée si son nom a changé
+            # (bar_distribution_2022.png -> bar_distribution_2023.png)
+            previous = manifests[zone].get(name, {}).get("file")
+            if previous and previous != file_name and os.path.exists(f"{results_directory}/{zone}/{previous}"):
+                os.remove(f"{results_directory}/{zone}/{previous}")
+            manifests[zone][name] = {"key": keys[zone, name], "file": file_name}
+
+    for zone in zones:
+        save_figures_manifest(zone, manifests[zone], results_directory)
+        profile_path = reports[zone].dump_hottest_profile(
+            f'{results_directory}/{zone}/profile_reader_{{stage}}.prof') if profile else None
+        reports[zone].save(f'{results_directory}/{zone}/run_report_reader.json',
+                           pipeline="region_data_reader", zone=zone, workers=workers, dpi=dpi,
+                           rendered=sorted(name for z, name in stale if z == zone and (z, name) not in failed),
+                           failed=sorted(name for z, name in failed if z == zone),
+                           profile=profile_path)
+    return [task for task in stale if task not in failed], failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Graphiques des logements au fioul par zone")
+    parser.add_argument("--zones", nargs="+", default=None,
+                        help="par défaut : toutes les zones présentes dans --results-directory")
+    parser.add_argument("--figures", nargs="+", default=list(FIGURES), choices=list(FIGURES))
+    parser.add_argument("--dpi", type=int, default=DPI)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--show", action="store_true",
+                        help="affichage interactif, figure par figure, sans pool")
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    parser.add_argument("--force", action="store_true",
+                        help="redessine toutes les figures, même inchangées")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="pic mémoire tracemalloc de chaque étape dans le rapport d'exécution (plus lent)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profil cProfile de l'étape la plus longue (results/{zone}/profile_reader_*.prof)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    zones = args.zones or available_zones(args.results_directory)
+    if args.show:
+        for zone in zones:
+            for name in args.figures:
+                render_figure(zone, name, args.dpi, True, args.results_directory)
+    else:
+        rendered, failed = render_all(zones, args.figures, args.dpi, args.workers,
+                                      args.results_directory, args.force, args.trace_memory, args.profile)
+        print(f"{len(rendered)} figure(s) redessinée(s), "
+              f"{len(zones) * len(args.figures) - len(rendered) - len(failed)} inchangée(s)")
+        for (zone, name), error in sorted(failed.items()):
+            print(f"Zone {zone}, figure {name} en erreur : {error}")
+    for zone in zones:
+        print_summary(zone, args.results_directory)
+    if not args.show and failed:
+        raise SystemExit(1)
@@ -0,0 +1,231 @@
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+RESULTS_DIRECTORY = "results"
+
+ARRAYS = ("years", "aemm", "typl", "par_annee_emmenagement", "par_type_logement",
+          "present_aemm", "present_typl", "cumul_aemm")
+
+DECENNIES_DEBUT = 1950
+
+# Résultats d'une zone en tableaux denses (année d'enquête x AEMM et année
+# d'enquête x TYPL), un fichier .npy par tableau dans results/{zone}/store,
+# relus en mémoire mappée. Les masques present_* distinguent une case absente
+# des fichiers JSON d'une case présente de poids nul.
+#
+# cumul_aemm (année d'enquête x AEMM + 1 x 1 + TYPL) contient les sommes
+# cumulées le long de l'axe AEMM : colonne 0 pour tous les types, puis une
+# colonne par code de typl quand les résultats viennent des agrégats
+# partiels (AEMM x TYPL). Les logements dont l'AEMM est entre aemm[i] et
+# aemm[j - 1] sont cumul_aemm[:, j] - cumul_aemm[:, i], quel que soit
+# l'intervalle.
+
+
+def store_directory(zone, results_directory=RESULTS_DIRECTORY):
+    return f'{results_directory}/{zone}/store'
+
+
+# Manifeste de region_data_generator.py (results/{zone}/manifest.json) :
+# signature du zip, agrégat et cube partiels de chaque année, relus par
+# rollup.py et aggregate_service.py
+def manifest_path(zone, results_directory=RESULTS_DIRECTORY):
+    return f'{results_directory}/{zone}/manifest.json'
+
+
+def load_manifest(zone, results_directory=RESULTS_DIRECTORY):
+    try:
+        with open(manifest_path(zone, results_directory), 'r', encoding='utf-8') as f:
+            return {int(year): entry for year, entry in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(zone, manifest, results_directory=RESULTS_DIRECTORY):
+    path = manifest_path(zone, results_directory)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def partial_paths(year):
+    # Agrégat fioul et cube partiels de l'année, relatifs à results/{zone}
+    return f'partials/{year}.npz', f'partials/{year}_cube.npz'
+
+
+def save_arrays(directory, arrays, meta):
+    # Répertoire de tableaux .npy (store d'une zone, table des communes) :
+    # meta.json est retiré d'abord et écrit en dernier, un répertoire
+    # interrompu reste invalide, même s'il en remplaçait un autre. Chaque
+    # tableau remplace l'ancien fichier (os.replace), sans écraser un fichier
+    # encore relu en mémoire mappée.
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(f'{directory}/meta.json'):
+        os.remove(f'{directory}/meta.json')
+    for name, array in arrays.items():
+        with open(f'{directory}/{name}.npy.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(f'{directory}/{name}.npy.tmp', f'{directory}/{name}.npy')
+    with open(f'{directory}/meta.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump(dict(arrays=list(arrays), **meta), f, indent=2)
+    os.replace(f'{directory}/meta.json.tmp', f'{directory}/meta.json')
+
+
+def _dense(per_year, years):
+    labels = np.array(sorted({code for values in per_year.values() for code in values}), dtype=np.int64)
+    weights = np.zeros((len(years), len(labels)))
+    present = np.zeros((len(years), len(labels)), dtype=bool)
+    for row, year in enumerate(years):
+        values = per_year.get(year, {})
+        columns = np.searchsorted(labels, list(values))
+        weights[row, columns] = list(values.values())
+        present[row, columns] = True
+    return labels, weights, present
+
+
+def _cumul(weights):
+    # Sommes cumulées le long de l'axe 1, précédées d'une tranche nulle
+    return np.concatenate([np.zeros_like(weights[:, :1]), np.cumsum(weights, axis=1)], axis=1)
+
+
+def decennies(results, first=DECENNIES_DEBUT, width=10):
+    # Débuts et fins des tranches d'AEMM de width années à partir de first,
+    # la dernière s'arrête à la dernière année d'emménagement des résultats
+    last = int(np.max(results.aemm))
+    starts = np.arange(first, last + 1, width)
+    return starts, np.minimum(starts + width - 1, last)
+
+
+class ZoneResults:
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_dicts(cls, fioul_par_annee_emmenagement, fioul_par_type_logement, fioul_par_annee_et_type=None):
+        years = np.array(sorted(fioul_par_annee_emmenagement), dtype=np.int64)
+        aemm, par_annee_emmenagement, present_aemm = _dense(fioul_par_annee_emmenagement, years)
+        typl, par_type_logement, present_typl = _dense(fioul_par_type_logement, years)
+        per_type = [par_annee_emmenagement[:, :, None]]
+        if fioul_par_annee_et_type is not None:
+            par_annee_et_type = np.zeros((len(years), len(aemm), len(typl)))
+            for row, year in enumerate(years):
+                for code, values in fioul_par_annee_et_type.get(year, {}).items():
+                    column = np.searchsorted(aemm, code)
+                    par_annee_et_type[row, column, np.searchsorted(typl, list(values))] = list(values.values())
+            per_type.append(par_annee_et_type)
+        return cls(dict(years=years, aemm=aemm, typl=typl,
+                        par_annee_emmenagement=par_annee_emmenagement,
+                        par_type_logement=par_type_logement,
+                        present_aemm=present_aemm, present_typl=present_typl,
+                        cumul_aemm=_cumul(np.concatenate(per_type, axis=2))))
+
+    @classmethod
+    def from_aggregates(cls, aggregates):
+        # aggregates : {année: FioulAggregate}
+        return cls.from_dicts({year: aggregate.par_annee_emmenagement() for year, aggregate in aggregates.items()},
+                              {year: aggregate.par_type_logement() for year, aggregate in aggregates.items()},
+                              {year: aggregate.par_annee_et_type() for year, aggregate in aggregates.items()})
+
+    @classmethod
+    def from_json(cls, zone, results_directory=RESULTS_DIRECTORY):
+        dicts = []
+        for name in ("fioul_par_annee_emmenagement", "fioul_par_type_logement"):
+            with open(f'{results_directory}/{zone}/{name}.json', 'r', encoding='utf-8') as f:
+                dicts.append({int(k): {int(ki): vi for ki, vi in v.items()} for k, v in json.load(f).items()})
+        return cls.from_dicts(*dicts)
+
+    def save(self, zone, results_directory=RESULTS_DIRECTORY):
+        save_arrays(store_directory(zone, results_directory), {name: getattr(self, name) for name in ARRAYS},
+                    {"years": [int(y) for y in self.years]})
+
+    @classmethod
+    def load(cls, zone, results_directory=RESULTS_DIRECTORY):
+        directory = store_directory(zone, results_directory)
+        if not os.path.exists(f'{directory}/meta.json'):
+            return None
+        arrays = {name: np.load(f'{directory}/{name}.npy', mmap_mode='r') for name in ARRAYS
+                  if os.path.exists(f'{directory}/{name}.npy')}
+        if "cumul_aemm" not in arrays:
+            # Store écrit avant les sommes cumulées : tous types seulement
+            arrays["cumul_aemm"] = _cumul(np.asarray(arrays["par_annee_emmenagement"])[:, :, None])
+        return cls(arrays)
+
+    def row(self, year):
+        # Ligne de l'année d'enquête, -1 si elle est absente
+        rows = np.flatnonzero(self.years == year)
+        return int(rows[0]) if len(rows) else -1
+
+    def aemm_ranges(self, starts, ends, typl=None):
+        # Logements de chaque année d'enquête (lignes) dont l'AEMM est dans
+        # [starts[k], ends[k]] (colonnes) : deux lectures de cumul_aemm par
+        # intervalle, restreintes aux codes typl s'ils sont donnés
+        left = np.searchsorted(self.aemm, np.atleast_1d(starts), side='left')
+        right = np.maximum(np.searchsorted(self.aemm, np.atleast_1d(ends), side='right'), left)
+        if typl is None:
+            columns = [0]
+        elif self.cumul_aemm.shape[2] == 1:
+            raise ValueError("Résultats sans croisement AEMM x TYPL (relus des fichiers JSON)")
+        else:
+            columns = 1 + np.flatnonzero(np.isin(self.typl, typl))
+        rows = np.arange(len(self.years))
+        cumul = self.cumul_aemm
+        return (cumul[np.ix_(rows, right, columns)] - cumul[np.ix_(rows, left, columns)]).sum(axis=2)
+
+    def to_dicts(self):
+        # Format des fichiers JSON : {année: {code: poids}}, cases présentes seules
+        def nested(labels, weights, present):
+            return {int(year): {int(code): float(w) for code, w, p in zip(labels, weights[row], present[row]) if p}
+                    for row, year in enumerate(self.years)}
+        return (nested(self.aemm, self.par_annee_emmenagement, self.present_aemm),
+                nested(self.typl, self.par_type_logement, self.present_typl))
+
+    def export_json(self, zone, results_directory=RESULTS_DIRECTORY):
+        fioul_par_annee_emmenagement, fioul_par_type_logement = self.to_dicts()
+        with open(f'{results_directory}/{zone}/fioul_par_annee_emmenagement.json', 'w', encoding='utf-8') as f:
+            json.dump(fioul_par_annee_emmenagement, f, indent=2, ensure_ascii=False)
+
+        with open(f'{results_directory}/{zone}/fioul_par_type_logement.json', 'w', encoding='utf-8') as f:
+            json.dump(fioul_par_type_logement, f, indent=2, ensure_ascii=False)
+
+
+def load_results(zone, results_directory=RESULTS_DIRECTORY):
+    # Store binaire s'il existe, sinon fichiers JSON (résultats antérieurs)
+    results = ZoneResults.load(zone, results_directory)
+    if results is None:
+        results = ZoneResults.from_json(zone, results_directory)
+    return results
+
+
+def available_zones(results_directory=RESULTS_DIRECTORY):
+    stores = glob.glob(f"{results_directory}/*/store/meta.json")
+    jsons = glob.glob(f"{results_directory}/*/fioul_par_type_logement.json")
+    return sorted({os.path.basename(os.path.dirname(os.path.dirname(path))) for path in stores} |
+                  {os.path.basename(os.path.dirname(path)) for path in jsons})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export JSON ou conversion en store binaire des résultats")
+    parser.add_argument("--zones", nargs="+", default=None)
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    parser.add_argument("--to-store", action="store_true",
+                        help="convertit les fichiers JSON existants en store binaire")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for zone in args.zones or available_zones(args.results_directory):
+        if args.to_store:
+            ZoneResults.from_json(zone, args.results_directory).save(zone, args.results_directory)
+        else:
+            results = ZoneResults.load(zone, args.results_directory)
+            if results is None:
+                # Zone sans store : ses fichiers JSON sont déjà les résultats
+                print(f"Zone {zone} : pas de store dans {store_directory(zone, args.results_directory)}")
+                continue
+            results.export_json(zone, args.results_directory)
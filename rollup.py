@@ -0,0 +1,76 @@
+import argparse
+import json
+
+import numpy as np
+
+from cube import AXES, MISSING, Cube
+from fd_logemt import ZONES
+from logements_db import parse_filter
+from results_store import RESULTS_DIRECTORY, load_manifest
+
+# Totaux multi-zones sans relire les zips : somme des cubes partiels
+# (results/{zone}/partials/{année}_cube.npz, un par couple zone/année,
+# écrits par region_data_generator.py). Les axes de chaque cube portent
+# leurs codes, les cubes s'additionnent sur l'union des codes (Cube.merged).
+
+
+def zone_partials(zone, years=None, results_directory=RESULTS_DIRECTORY):
+    manifest = load_manifest(zone, results_directory)
+    missing = [year for year, entry in manifest.items() if "cube" not in entry]
+    if missing:
+        raise ValueError(f"Zone {zone} : pas de cube partiel pour {missing}, relancer region_data_generator.py")
+    partials = [Cube.load(f'{results_directory}/{zone}/{entry["cube"]}')
+                for year, entry in sorted(manifest.items()) if years is None or year in years]
+    # Une zone sans cube partiel ne compte pas pour zéro : le total
+    # serait présenté comme national sans elle
+    if not partials:
+        wanted = "" if years is None else f" pour les années {sorted(years)}"
+        raise ValueError(f"Zone {zone} : aucun cube partiel{wanted} dans {results_directory}/{zone}, "
+                         "lancer region_data_generator.py")
+    return partials
+
+
+def rollup_cube(zones=(), regions=(), years=None, results_directory=RESULTS_DIRECTORY):
+    # Zones entières plus régions isolées (lues dans la zone qui les
+    # contient), ex. zones=["B"], regions=[11] ; toute la France par défaut
+    zones, regions = list(zones), list(regions)
+    unknown = [region for region in regions if not any(region in codes for codes in ZONES.values())]
+    if unknown:
+        raise ValueError(f"Régions inconnues : {unknown}")
+    if not zones and not regions:
+        zones = list(ZONES)
+    sources = sorted(set(zones) | {zone for zone, codes in ZONES.items() if set(codes) & set(regions)})
+    cube = Cube.merged(partial for zone in sources for partial in zone_partials(zone, years, results_directory))
+    if regions:
+        # Les lignes sans REGION valide des zones entières sont écartées
+        cube = cube.slice(REGION=sorted({r for zone in zones for r in ZONES[zone]} | set(regions)))
+    return cube
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Totaux nationaux ou par régions depuis les cubes partiels")
+    parser.add_argument("--zones", nargs="+", default=[], choices=list(ZONES))
+    parser.add_argument("--regions", nargs="+", type=int, default=[], help="codes REGION de l'Insee, ex. 11")
+    parser.add_argument("--years", nargs="+", type=int, default=None)
+    parser.add_argument("--by", nargs="+", default=["year"], choices=list(AXES), help="un ou deux axes")
+    parser.add_argument("--filter", nargs="+", default=[], help="ex. CMBL=3 AEMM=1950:1969 TYPL=1,2")
+    parser.add_argument("--counts", action="store_true", help="nombre de lignes au lieu des poids IPONDL")
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    parser.add_argument("--output", default=None, help="cube fusionné (.npz), relu par Cube.load")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cube = rollup_cube(args.zones, args.regions, args.years, args.results_directory)
+    if args.output:
+        cube.save(args.output)
+    filters = dict(parse_filter(text) for text in args.filter)
+    if len(args.by) == 2:
+        print(json.dumps(cube.to_dict(*args.by, counts=args.counts, **filters), indent=2))
+    else:
+        weights, (labels,) = cube.rollup(*args.by, counts=args.counts, **filters)
+        for label, weight in zip(labels, weights):
+            if label != MISSING and weight != 0:
+                print(label, f"{weight:.0f}")
+        print("total", f"{np.sum(weights):.0f}")
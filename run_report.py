@@ -0,0 +1,177 @@
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import resource
+import time
+import tracemalloc
+
+# Rapport d'exécution par étape (durée, temps CPU, lignes, octets, pics
+# mémoire). Chaque processus a au plus un rapport actif : les fonctions du
+# pipeline appellent stage(nom), sans effet quand aucun rapport n'est actif.
+# Les étapes imbriquées (lecture > decompression) sont comptées dans leur
+# parente ; les pics mémoire RSS sont le maximum atteint par le processus.
+
+_active = None
+
+
+def _empty_entry():
+    return {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "bytes": 0,
+            "peak_rss_mb": 0.0, "peak_traced_mb": 0.0}
+
+
+def peak_rss_mb():
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _RawStats:
+    # Statistiques cProfile brutes (transmissibles entre processus) pour pstats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RunReport:
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.stages = {}
+        self.profiles = {}
+        self.started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._stack = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        entry = self.stages.setdefault(name, _empty_entry())
+        # Un seul profileur à la fois : seules les étapes de premier niveau
+        # sont profilées
+        profiler = cProfile.Profile() if self.profile and not self._stack else None
+        if self.trace_memory:
+            if self._stack:
+                self._stack[-1] = max(self._stack[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield entry
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+                self._add_profile(name, profiler.stats)
+            entry["calls"] += 1
+            entry["wall_seconds"] += time.perf_counter() - wall
+            entry["cpu_seconds"] += time.process_time() - cpu
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb())
+            traced = self._stack.pop()
+            if self.trace_memory:
+                traced = max(traced, tracemalloc.get_traced_memory()[1])
+                entry["peak_traced_mb"] = max(entry["peak_traced_mb"], traced / 1e6)
+                if self._stack:
+                    self._stack[-1] = max(self._stack[-1], traced)
+
+    def _add_profile(self, name, stats):
+        if name in self.profiles:
+            merged = pstats.Stats(_RawStats(self.profiles[name]))
+            merged.add(_RawStats(stats))
+            stats = merged.stats
+        self.profiles[name] = stats
+
+    def merge(self, other):
+        # other : to_dict(profiles=True) d'un rapport de processus du pool
+        for name, stage in other["stages"].items():
+            entry = self.stages.setdefault(name, _empty_entry())
+            for key in ("calls", "wall_seconds", "cpu_seconds", "rows", "bytes"):
+                entry[key] += stage[key]
+            for key in ("peak_rss_mb", "peak_traced_mb"):
+                entry[key] = max(entry[key], stage[key])
+        for name, stats in other.get("profiles", {}).items():
+            self._add_profile(name, stats)
+        return self
+
+    def to_dict(self, profiles=False):
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._wall,
+            "cpu_seconds": time.process_time() - self._cpu,
+            "peak_rss_mb": max([peak_rss_mb()] + [s["peak_rss_mb"] for s in self.stages.values()]),
+            "stages": self.stages,
+        }
+        if profiles:
+            report["profiles"] = self.profiles
+        return report
+
+    def dump_hottest_profile(self, path_pattern):
+        # Profil cProfile de l'étape profilée la plus longue ; path_pattern
+        # reçoit le nom de l'étape, ex. 'results/A/profile_{stage}.prof'
+        if not self.profiles:
+            return None
+        stage = max(self.profiles, key=lambda name: self.stages[name]["wall_seconds"])
+        path = path_pattern.format(stage=stage.replace("/", "_"))
+        pstats.Stats(_RawStats(self.profiles[stage])).dump_stats(path)
+        return path
+
+    def save(self, path, **fields):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(fields, **self.to_dict()), f, indent=2)
+
+
+@contextlib.contextmanager
+def active(report):
+    global _active
+    previous, _active = _active, report
+    try:
+        yield report
+    finally:
+        _active = previous
+
+
+def stage(name):
+    if _active is None:
+        return contextlib.nullcontext(_empty_entry())
+    return _active.stage(name)
+
+
+class _TimedFile:
+    # Lectures d'un fichier (membre de zip : décompression) comptées dans une étape
+
+    def __init__(self, f, name):
+        self.f = f
+        self.name = name
+
+    def read(self, *args):
+        with stage(self.name) as entry:
+            data = self.f.read(*args)
+            entry["bytes"] += len(data)
+        return data
+
+    def readline(self, *args):
+        with stage(self.name) as entry:
+            line = self.f.readline(*args)
+            entry["bytes"] += len(line)
+        return line
+
+
+def timed_file(f, name):
+    return f if _active is None else _TimedFile(f, name)
+
+
+def collect(function, *args, trace_memory=False, profile=False, **kwargs):
+    # Appel de function sous un rapport propre, pour les processus du pool :
+    # renvoie (résultat, rapport à fusionner avec RunReport.merge)
+    report = RunReport(trace_memory, profile)
+    with active(report):
+        result = function(*args, **kwargs)
+    return result, report.to_dict(profiles=True)
@@ -0,0 +1,148 @@
+import argparse
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fd_logemt import ZONES, member_name, zip_path
+from mod_logemt import read_dictionary
+
+MOD_PATH = "data/MOD_LOGEMT_2015.txt"
+SAMPLE_PATH = "data/melun/melun_2015.csv"
+SYNTHETIC_DIRECTORY = "data/synthetic"
+
+BLOCK_ROWS = 200_000
+
+# Compression rapide : la décompression, seule mesurée par les benchmarks,
+# coûte autant quel que soit le niveau
+COMPRESS_LEVEL = 1
+
+# Départements de chaque région (codes REGION de ZONES), pour des codes
+# COMMUNE / IRIS / TRIRIS plausibles
+DEPARTEMENTS = {
+    11: ["75", "77", "78", "91", "92", "93", "94", "95"],
+    24: ["18", "28", "36", "37", "41", "45"],
+    27: ["21", "25", "39", "58", "70", "71", "89", "90"],
+    28: ["14", "27", "50", "61", "76"],
+    32: ["02", "59", "60", "62", "80"],
+    44: ["08", "10", "51", "52", "54", "55", "57", "67", "68", "88"],
+    52: ["44", "49", "53", "72", "85"],
+    53: ["22", "29", "35", "56"],
+    75: ["16", "17", "19", "23", "24", "33", "40", "47", "64", "79", "86", "87"],
+    76: ["09", "11", "12", "30", "31", "32", "34", "46", "48", "65", "66", "81", "82"],
+    84: ["01", "03", "07", "15", "26", "38", "42", "43", "63", "69", "73", "74"],
+    93: ["04", "05", "06", "13", "83", "84"],
+    94: ["2A", "2B"],
+    1: ["971"],
+    2: ["972"],
+    3: ["973"],
+    4: ["974"],
+}
+
+# Fichiers détail synthétiques au format FD_LOGEMT 2015 : colonnes et
+# modalités de MOD_LOGEMT, fréquences de chaque modalité tirées d'un extrait
+# réel (Melun 2015, lissées pour que toutes les modalités apparaissent),
+# IPONDL rééchantillonné sur l'extrait et écrit avec une virgule décimale.
+
+
+def read_modalities(path=MOD_PATH):
+    # {variable: [codes]} dans l'ordre des colonnes des fichiers détail ;
+    # liste vide pour les variables sans modalités (COMMUNE, IRIS, IPONDL, ...)
+    return {name: variable.codes for name, variable in read_dictionary(path).items()}
+
+
+class SyntheticSource:
+
+    def __init__(self, zone, modalities, sample=None, seed=0):
+        self.zone = zone
+        self.columns = list(modalities)
+        self.rng = np.random.default_rng(seed)
+        self.distributions = {}
+        for column, codes in modalities.items():
+            if not codes or column == "REGION":
+                continue
+            weights = np.ones(len(codes))
+            if sample is not None and column in sample:
+                counts = sample[column].value_counts()
+                # Les variables de comptage (INPER, INP11M, ...) n'ont dans
+                # MOD_LOGEMT que leurs codes hors champ : valeurs de l'extrait
+                codes = codes + sorted(code for code in counts.index if code not in codes)
+                weights = 1 + np.array([counts.get(code, 0) for code in codes])
+            self.distributions[column] = (np.array(codes), weights / weights.sum())
+        ipondl = None if sample is None else pd.to_numeric(
+            sample["IPONDL"].str.replace(",", "."), errors="coerce").dropna().to_numpy()
+        self.ipondl = ipondl if ipondl is not None and len(ipondl) else np.array([1.0, 2.0, 5.0])
+
+        self.departements = np.array([d for region in ZONES[zone] for d in DEPARTEMENTS[region]])
+        self.regions = np.array([str(region).zfill(2) for region in ZONES[zone]
+                                 for _ in DEPARTEMENTS[region]])
+
+    def block(self, n, decimal=","):
+        # Texte de n lignes, colonne par colonne puis ligne par ligne
+        departement = self.rng.integers(len(self.departements), size=n)
+        dept = self.departements[departement]
+        number = self.rng.integers(1, 700, size=n)
+        # Codes commune à 5 caractères : 77288, 2A004, 97411
+        suffix = np.where(np.char.str_len(dept) == 3, np.char.zfill((number % 100).astype(str), 2),
+                          np.char.zfill(number.astype(str), 3))
+        commune = np.char.add(dept, suffix)
+        iris = np.char.add(commune, np.char.zfill(self.rng.integers(1, 20, size=n).astype(str), 4))
+        ipondl = self.ipondl[self.rng.integers(len(self.ipondl), size=n)] * self.rng.lognormal(0, 0.05, size=n)
+        # 14 décimales comme les fichiers réels, formatées en entiers
+        whole = np.floor(ipondl)
+        fraction = np.round((ipondl - whole) * 1e14).astype(np.int64).clip(0, 10 ** 14 - 1)
+
+        values = {
+            "COMMUNE": commune,
+            "ARM": np.full(n, "ZZZZZ"),
+            "IRIS": iris,
+            "TRIRIS": np.char.add(dept, np.char.zfill(self.rng.integers(1, 300, size=n).astype(str), 4)),
+            "REGION": self.regions[departement],
+            "IPONDL": np.char.add(np.char.add(whole.astype(np.int64).astype(str), decimal),
+                                  np.char.zfill(fraction.astype(str), 14)),
+        }
+        for column, (codes, p) in self.distributions.items():
+            values[column] = codes[self.rng.choice(len(codes), size=n, p=p)]
+
+        columns = [values[column].tolist() for column in self.columns]
+        return ("\n".join(";".join(row) for row in zip(*columns)) + "\n").encode('latin-1')
+
+
+def write_year(zone, year, rows, data_directory=SYNTHETIC_DIRECTORY, seed=0, decimal=",",
+               mod_path=MOD_PATH, sample_path=SAMPLE_PATH):
+    modalities = read_modalities(mod_path)
+    sample = pd.read_csv(sample_path, sep=';', dtype=str) if os.path.exists(sample_path) else None
+    source = SyntheticSource(zone, modalities, sample, seed=seed + year)
+
+    path = zip_path(zone, year, data_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as z:
+        with z.open(member_name(zone, year), 'w', force_zip64=True) as f:
+            f.write((";".join(source.columns) + "\n").encode('latin-1'))
+            for start in range(0, rows, BLOCK_ROWS):
+                f.write(source.block(min(BLOCK_ROWS, rows - start), decimal))
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fichiers FD_LOGEMT synthétiques (zips) pour les benchmarks")
+    parser.add_argument("--zones", nargs="+", default=["A"], choices=list(ZONES))
+    parser.add_argument("--years", nargs="+", type=int, default=[2015])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--decimal", default=",", choices=[",", "."])
+    parser.add_argument("--data-directory", default=SYNTHETIC_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(write_year, zone, year, args.rows, args.data_directory, args.seed, args.decimal)
+                   for zone in args.zones for year in args.years]
+        for future in futures:
+            path = future.result()
+            print(f"{path} : {args.rows} lignes, {os.path.getsize(path) / 1e6:.1f} Mo")